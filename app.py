@@ -1,42 +1,395 @@
 import os
+import atexit
 import json
 import re
 import random
+import math
+import mimetypes
+import multiprocessing
+import shutil
+import copy
+import functools
+import gc
+import hashlib
+import heapq
+import hmac
+import queue
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import uuid
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+import contextlib
+from contextlib import contextmanager
 from datetime import datetime
 from flask import (
-    Flask, render_template, request, redirect, send_file,
-    send_from_directory, session, jsonify, url_for
+    Flask, abort, render_template, request, redirect, send_file,
+    session, jsonify, url_for, stream_with_context
 )
-from werkzeug.utils import secure_filename
-from pdf2image import convert_from_path
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.utils import safe_join, secure_filename
 from io import BytesIO
-from docx import Document
-import spacy
 
-import openai
+import pdf_render
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
 
 # Initialize Flask app
 app = Flask(__name__)
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', 'your_secret_key')  # Change for production!
 
-# Load spaCy model
-nlp = spacy.load('en_core_web_sm', disable=['parser', 'ner'])
+# spaCy, python-docx and openai are imported on first use so workers that only
+# serve login/timetable/notes routes start fast. Note and assignment writes only
+# need spaCy in the background search indexer (reindex_async). See
+# preload_models() for sharing them across forked gunicorn workers.
+_nlp = None
+_nlp_lock = threading.Lock()
+
+def get_nlp():
+    global _nlp
+    if _nlp is None:
+        with _nlp_lock:
+            if _nlp is None:
+                import spacy
+                _nlp = spacy.load('en_core_web_sm', disable=['parser', 'ner'])
+    return _nlp
 
 # Allowed file extensions
 ALLOWED_DOC_EXTS = {'pdf', 'png', 'jpg', 'jpeg', 'docx'}
 ALLOWED_HANDWRITING_EXTS = {'pdf', 'png', 'jpg', 'jpeg'}
 
-# Upload folders setup
-UPLOAD_FOLDER = 'uploads'
+# Upload folders setup. STUDIST_DATA_DIR moves uploads, blobs and generated files
+# (and the default database) together, e.g. onto a volume shared by several hosts.
+DATA_DIR = os.environ.get('STUDIST_DATA_DIR', '')
+UPLOAD_FOLDER = os.path.join(DATA_DIR, 'uploads')
 NOTES_FOLDER = 'user_notes'
+GENERATED_FOLDER = os.path.join(DATA_DIR, 'generated')
+BLOB_FOLDER = os.path.join(DATA_DIR, 'blobs')
+UPLOAD_CHUNK_SIZE = 1024 * 1024
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(NOTES_FOLDER, exist_ok=True)
+os.makedirs(GENERATED_FOLDER, exist_ok=True)
+os.makedirs(os.path.join(BLOB_FOLDER, 'tmp'), exist_ok=True)
+os.makedirs(os.path.join(BLOB_FOLDER, 'partial'), exist_ok=True)
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 32 * 1024 * 1024  # 32 MB
+app.config['MAX_UPLOAD_SIZE'] = 1024 * 1024 * 1024  # 1 GB, for chunked upload sessions
+app.config['FILES_PER_PAGE'] = 50
+app.config['UPLOAD_STALE_SECONDS'] = float(os.environ.get('STUDIST_UPLOAD_STALE_SECONDS', 24 * 3600))
+app.config['SENDFILE_MODE'] = os.environ.get('STUDIST_SENDFILE', '')  # '', 'x-sendfile' or 'x-accel'
+app.config['USE_X_SENDFILE'] = app.config['SENDFILE_MODE'] == 'x-sendfile'
+app.config['SENDFILE_ROOT'] = os.path.abspath(os.environ.get('STUDIST_SENDFILE_ROOT', '.'))
+app.config['X_ACCEL_PREFIX'] = os.environ.get('STUDIST_X_ACCEL_PREFIX', '/_files').rstrip('/')
+app.config['STORAGE_BACKEND'] = os.environ.get('STUDIST_STORAGE', 'sqlite')  # 'sqlite' or 'json'
+app.config['STORAGE_PATH'] = os.environ.get('STUDIST_DB', os.path.join(DATA_DIR, 'studist.db'))
+app.config['SESSION_BACKEND'] = os.environ.get('STUDIST_SESSION_BACKEND', 'cookie')  # 'cookie' or 'store'
+app.config['DOC_CACHE_SIZE'] = int(os.environ.get('STUDIST_DOC_CACHE_SIZE', 1024))
+app.config['SEARCH_CACHE_SIZE'] = int(os.environ.get('STUDIST_SEARCH_CACHE_SIZE', 4096))
+app.config['NLP_BATCH_WINDOW_MS'] = float(os.environ.get('STUDIST_NLP_BATCH_WINDOW_MS', 3))
+app.config['NLP_BATCH_SIZE'] = int(os.environ.get('STUDIST_NLP_BATCH_SIZE', 32))
+app.config['LEMMA_CACHE_SIZE'] = int(os.environ.get('STUDIST_LEMMA_CACHE_SIZE', 4096))
+app.config['RENDER_WORKERS'] = int(os.environ.get('STUDIST_RENDER_WORKERS', 2))
+app.config['RENDER_TIMEOUT'] = float(os.environ.get('STUDIST_RENDER_TIMEOUT', 30))
+app.config['PAGE_CACHE_MAX_BYTES'] = int(os.environ.get('STUDIST_PAGE_CACHE_MAX_BYTES', 512 * 1024 * 1024))
+app.config['PRELOAD_MODELS'] = os.environ.get('STUDIST_PRELOAD', '') == '1'
+app.config['LLM_CLIENT'] = os.environ.get('STUDIST_LLM', 'openai')  # 'openai' or 'stub'
+app.config['LLM_STUB_LATENCY'] = float(os.environ.get('STUDIST_LLM_STUB_LATENCY', 0))
+app.config['ASSIGNMENT_WORKERS'] = int(os.environ.get('STUDIST_ASSIGNMENT_WORKERS', 4))
+app.config['ASSIGNMENT_JOBS_PER_USER'] = int(os.environ.get('STUDIST_ASSIGNMENT_JOBS_PER_USER', 2))
+app.config['ASSIGNMENT_MAX_PENDING'] = int(os.environ.get('STUDIST_ASSIGNMENT_MAX_PENDING', 64))
+app.config['ASSIGNMENT_JOB_TIMEOUT'] = float(os.environ.get('STUDIST_ASSIGNMENT_JOB_TIMEOUT', 60))
+app.config['ASSIGNMENT_RESULT_TTL'] = float(os.environ.get('STUDIST_ASSIGNMENT_RESULT_TTL', 3600))
+app.config['ASSIGNMENT_CACHE_MAX_BYTES'] = int(os.environ.get('STUDIST_ASSIGNMENT_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+app.config['ASSIGNMENT_CACHE_TTL'] = float(os.environ.get('STUDIST_ASSIGNMENT_CACHE_TTL', 7 * 24 * 3600))
+app.config['PASSWORD_HASH_METHOD'] = os.environ.get('STUDIST_PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+app.config['PASSWORD_WORKERS'] = int(os.environ.get('STUDIST_PASSWORD_WORKERS', os.cpu_count() or 1))
+app.config['PASSWORD_MAX_PENDING'] = int(os.environ.get('STUDIST_PASSWORD_MAX_PENDING', 32))
+app.config['PASSWORD_TIMEOUT'] = float(os.environ.get('STUDIST_PASSWORD_TIMEOUT', 10))
+# Each open /notifications/stream holds its worker, so only enable push when
+# gunicorn runs an async worker class (gevent/eventlet); otherwise pages poll.
+app.config['NOTIFICATION_PUSH'] = os.environ.get('STUDIST_NOTIFICATION_PUSH', '') == '1'
+app.config['BOOKMARK_FLUSH_SECONDS'] = float(os.environ.get('STUDIST_BOOKMARK_FLUSH_SECONDS', 2))
+app.config['METRICS_ENABLED'] = os.environ.get('STUDIST_METRICS', '') == '1'
+app.config['SLOW_REQUEST_MS'] = float(os.environ.get('STUDIST_SLOW_REQUEST_MS', 1000))
+app.config['SLOW_REQUEST_LOG'] = os.environ.get('STUDIST_SLOW_REQUEST_LOG', 'slow_requests.log')
+app.config['STACK_SAMPLE_INTERVAL_MS'] = float(os.environ.get('STUDIST_STACK_SAMPLE_INTERVAL_MS', 50))
+
+# ---------- Instrumentation ----------
+class Metrics:
+    """In-process counters and latency histograms, rendered as Prometheus text.
+
+    Only created when STUDIST_METRICS=1. Each gunicorn worker keeps its own
+    numbers, so scrape every worker (or sum them) for the whole picture.
+    """
+
+    BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}    # (metric, labels) -> value
+        self._histograms = {}  # (metric, labels) -> [bucket counts..., sum, count]
+
+    def inc(self, metric: str, labels: tuple, value: float = 1) -> None:
+        with self._lock:
+            self._counters[(metric, labels)] = self._counters.get((metric, labels), 0) + value
+
+    def observe(self, metric: str, labels: tuple, seconds: float) -> None:
+        with self._lock:
+            hist = self._histograms.get((metric, labels))
+            if hist is None:
+                hist = self._histograms[(metric, labels)] = [0] * (len(self.BUCKETS) + 2)
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    hist[i] += 1
+            hist[-2] += seconds
+            hist[-1] += 1
+
+    @staticmethod
+    def _labels(labels: tuple, extra: str = '') -> str:
+        parts = [f'{name}="{value}"' for name, value in labels]
+        if extra:
+            parts.append(extra)
+        return '{' + ','.join(parts) + '}' if parts else ''
+
+    def render(self) -> str:
+        with self._lock:
+            counters = sorted(self._counters.items())
+            histograms = sorted((key, list(hist)) for key, hist in self._histograms.items())
+        lines = []
+        seen = set()
+        inf = 'le="+Inf"'
+        for (metric, labels), value in counters:
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            lines.append(f"{metric}{self._labels(labels)} {value:g}")
+        for (metric, labels), hist in histograms:
+            if metric not in seen:
+                seen.add(metric)
+                lines.append(f"# TYPE {metric} histogram")
+            for bound, count in zip(self.BUCKETS, hist):
+                le = 'le="%g"' % bound
+                lines.append(f"{metric}_bucket{self._labels(labels, le)} {count}")
+            lines.append(f"{metric}_bucket{self._labels(labels, inf)} {hist[-1]}")
+            lines.append(f"{metric}_sum{self._labels(labels)} {hist[-2]:.6f}")
+            lines.append(f"{metric}_count{self._labels(labels)} {hist[-1]}")
+        return '\n'.join(lines) + '\n'
+
+METRICS = Metrics() if app.config['METRICS_ENABLED'] else None
+
+# Span totals of the request running on this thread (see InstrumentationMiddleware).
+_request_spans = threading.local()
+# Span names open on this thread; a nested span of the same name is timed by the outer one.
+_open_spans = threading.local()
+
+@contextmanager
+def _timed_span(name: str):
+    names = getattr(_open_spans, 'names', None)
+    if names is None:
+        names = _open_spans.names = set()
+    if name in names:
+        yield
+        return
+    names.add(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        names.discard(name)
+        elapsed = time.perf_counter() - start
+        METRICS.observe('studist_span_seconds', (('span', name),), elapsed)
+        spans = getattr(_request_spans, 'spans', None)
+        if spans is not None:
+            spans[name] = spans.get(name, 0.0) + elapsed
+
+_NO_SPAN = contextlib.nullcontext()
+
+def span(name: str):
+    """``with span('name'):`` times a block; a shared no-op when metrics are off."""
+    return _timed_span(name) if METRICS is not None else _NO_SPAN
+
+def instrumented(name: str):
+    """Decorator form of span(). Returns the function untouched when metrics are off."""
+    def decorate(fn):
+        if METRICS is None:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _timed_span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def count_bytes(direction: str, source: str, n: int) -> None:
+    if METRICS is not None:
+        METRICS.inc('studist_io_bytes_total', (('direction', direction), ('source', source)), n)
+
+class StackSampler:
+    """Samples the stacks of requests that have run longer than the slow threshold.
+
+    A daemon thread wakes every ``interval`` seconds and, only for requests past
+    ``threshold``, records the current stack of the thread serving them. When
+    such a request finishes, its sampled stacks (collapsed and counted) are
+    appended as one JSON line to ``path``.
+    """
+
+    def __init__(self, threshold: float, interval: float, path: str):
+        self.threshold = threshold
+        self.interval = interval
+        self.path = path
+        self._active = {}  # thread id -> request record
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def begin(self, record: dict) -> None:
+        with self._lock:
+            self._active[threading.get_ident()] = record
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+                self._thread.start()
+
+    def end(self, record: dict) -> None:
+        with self._lock:
+            self._active.pop(threading.get_ident(), None)
+        if record['duration'] < self.threshold:
+            return
+        entry = {
+            'time': datetime.now().isoformat(timespec='seconds'),
+            'method': record['method'],
+            'path': record['path'],
+            'route': record['route'],
+            'status': record['status'],
+            'duration_ms': round(record['duration'] * 1000, 1),
+            'spans_ms': {k: round(v * 1000, 1) for k, v in record['spans'].items()},
+            'stacks': [{'count': n, 'stack': s} for s, n in record['samples'].most_common()],
+        }
+        try:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry) + '\n')
+        except OSError:
+            pass
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            now = time.perf_counter()
+            with self._lock:
+                slow = [(tid, r) for tid, r in self._active.items() if now - r['start'] >= self.threshold]
+            if not slow:
+                continue
+            frames = sys._current_frames()
+            for tid, record in slow:
+                frame = frames.get(tid)
+                if frame is not None:
+                    stack = ';'.join(f"{os.path.basename(fs.filename)}:{fs.name}:{fs.lineno}"
+                                     for fs in traceback.extract_stack(frame))
+                    record['samples'][stack] += 1
+
+class InstrumentationMiddleware:
+    """WSGI wrapper that times each request, including streaming the body.
+
+    Records request latency per route and status, request/response bytes, and
+    the time spent in each span() while the request ran. Installed only when
+    STUDIST_METRICS=1, so a disabled deployment pays nothing per request.
+    """
+
+    def __init__(self, wsgi_app, metrics: Metrics, sampler: StackSampler):
+        self.wsgi_app = wsgi_app
+        self.metrics = metrics
+        self.sampler = sampler
+
+    def __call__(self, environ, start_response):
+        record = {
+            'start': time.perf_counter(),
+            'method': environ.get('REQUEST_METHOD', ''),
+            'path': environ.get('PATH_INFO', ''),
+            'route': None,
+            'status': '',
+            'spans': {},
+            'samples': Counter(),
+            'bytes_out': 0,
+        }
+        environ['studist.request'] = record
+        _request_spans.spans = record['spans']
+        self.sampler.begin(record)
+
+        def _start_response(status, headers, exc_info=None):
+            record['status'] = status.split(' ', 1)[0]
+            return start_response(status, headers, exc_info)
+
+        result = None
+        try:
+            result = self.wsgi_app(environ, _start_response)
+            for chunk in result:
+                record['bytes_out'] += len(chunk)
+                yield chunk
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+            _request_spans.spans = None
+            record['duration'] = time.perf_counter() - record['start']
+            self.sampler.end(record)
+            self._record(environ, record)
+
+    def _record(self, environ, record) -> None:
+        route = record['route'] or 'unmatched'
+        labels = (('route', route),)
+        self.metrics.observe('studist_request_seconds', labels, record['duration'])
+        self.metrics.inc('studist_requests_total', labels + (('status', record['status']),))
+        self.metrics.inc('studist_request_bytes_total', labels, int(environ.get('CONTENT_LENGTH') or 0))
+        self.metrics.inc('studist_response_bytes_total', labels, record['bytes_out'])
+        for name, seconds in record['spans'].items():
+            self.metrics.inc('studist_request_span_seconds_total', labels + (('span', name),), seconds)
+
+if METRICS is not None:
+    app.wsgi_app = InstrumentationMiddleware(app.wsgi_app, METRICS, StackSampler(
+        app.config['SLOW_REQUEST_MS'] / 1000,
+        app.config['STACK_SAMPLE_INTERVAL_MS'] / 1000,
+        app.config['SLOW_REQUEST_LOG'],
+    ))
+
+    @app.before_request
+    def _label_request_route():
+        record = request.environ.get('studist.request')
+        if record is not None and request.url_rule is not None:
+            record['route'] = request.url_rule.rule
+
+@app.route('/metrics')
+def metrics():
+    if METRICS is None:
+        abort(404)
+    return app.response_class(METRICS.render(), mimetype='text/plain; version=0.0.4')
 
 # --- Helper Functions ---
+def current_username(claimed=None):
+    """The logged-in user a request acts for, or None without a session.
+
+    A ``?user=`` parameter (or ``claimed``, a username sent in the body or URL)
+    is never taken as identity, only checked: naming anyone other than the
+    session user is refused with 403.
+    """
+    username = session.get('username')
+    if not username:
+        return None
+    claimed = claimed or request.args.get('user')
+    if claimed and claimed != username:
+        abort(403)
+    return username
+
 def ensure_user_folder(username: str) -> str:
     user_folder = os.path.join(app.config['UPLOAD_FOLDER'], username)
     os.makedirs(user_folder, exist_ok=True)
@@ -45,18 +398,48 @@ def ensure_user_folder(username: str) -> str:
 def allowed(filename: str, exts: set) -> bool:
     return ('.' in filename) and (filename.rsplit('.', 1)[1].lower() in exts)
 
+@instrumented('load_json')
 def load_json(path: str, default):
+    collection = COLLECTION_FILES.get(os.path.normpath(path))
+    if collection is not None:
+        return STORE.load_collection(collection, default)
+    return read_json_file(path, default)
+
+@instrumented('save_json')
+def save_json(path: str, data) -> None:
+    collection = COLLECTION_FILES.get(os.path.normpath(path))
+    if collection is not None:
+        STORE.save_collection(collection, data)
+        return
+    write_json_file(path, data)
+
+def read_json_file(path: str, default):
     if os.path.exists(path):
         try:
             with open(path, 'r', encoding='utf-8') as f:
-                return json.load(f)
+                data = json.load(f)
+                if METRICS is not None:
+                    count_bytes('read', 'json_file', os.fstat(f.fileno()).st_size)
+                return data
         except Exception:
             return default
     return default
 
-def save_json(path: str, data) -> None:
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+def write_json_file(path: str, data) -> None:
+    # Write to a temp file in the same directory and rename over the target so
+    # readers never see a half-written file.
+    folder = os.path.dirname(path) or '.'
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix='.tmp-', suffix='.json')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+            if METRICS is not None:
+                count_bytes('write', 'json_file', f.tell())
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
 
 def to_spotify_embed(url: str) -> str:
     m = re.match(r'https?://open\.spotify\.com/(playlist|track|album|artist|show|episode)/([A-Za-z0-9]+)', url)
@@ -65,14 +448,651 @@ def to_spotify_embed(url: str) -> str:
     kind, sid = m.group(1), m.group(2)
     return f"https://open.spotify.com/embed/{kind}/{sid}"
 
-def user_notes_path(username: str) -> str:
-    return os.path.join(NOTES_FOLDER, f"{username}_notes.json")
-
 def load_notes(username: str):
-    return load_json(user_notes_path(username), [])
+    """All of a user's notes, oldest first. See the Notes section below."""
+    migrate_legacy_notes(username)
+    notes = [note for _, note in STORE.scan('note_items', f"{username}/")]
+    return sorted(notes, key=lambda n: (n['created'], n['id']))
+
+# ---------- Storage ----------
+# Every shared JSON file is a "collection" of per-user documents. Routes read and
+# write one user's document at a time through STORE instead of the whole file.
+COLLECTION_FILES = {
+    'users.json': 'users',
+    'reminders.json': 'reminders',
+    'assignments.json': 'assignments',
+    'bookmarks.json': 'bookmarks',
+    'timetable.json': 'timetable',
+    'subjects.json': 'subjects',
+    'spotify.json': 'spotify',
+}
+
+def _users_to_mapping(users) -> dict:
+    # users.json is a list of records; the store keys them by username.
+    if isinstance(users, dict):
+        return users
+    return {u.get('username'): u for u in users or [] if isinstance(u, dict) and u.get('username')}
+
+class SqliteStore:
+    """Per-user documents in an embedded SQLite database (WAL mode).
+
+    Each (collection, key) pair is one row holding a JSON document, so reads and
+    writes cost one user's data instead of the whole collection. ``update`` runs
+    its read-modify-write inside ``BEGIN IMMEDIATE`` so concurrent workers
+    serialize instead of losing updates.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS docs ("
+            " collection TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+            " version INTEGER NOT NULL DEFAULT 1,"
+            " PRIMARY KEY (collection, key))"
+        )
+        conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        # Row versions come from one counter, never reused: a deleted and
+        # re-created row must not repeat a version another worker has cached.
+        conn.execute("CREATE TABLE IF NOT EXISTS seq (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        conn.execute("INSERT OR IGNORE INTO seq (name, value)"
+                     " SELECT 'version', COALESCE(MAX(version), 0) FROM docs")
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread, reopened after a fork (gunicorn workers).
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _read(self, conn, collection: str, key: str, default):
+        row = conn.execute(
+            "SELECT value FROM docs WHERE collection = ? AND key = ?", (collection, key)
+        ).fetchone()
+        if not row:
+            return copy.deepcopy(default)
+        count_bytes('read', 'store', len(row[0]))
+        return json.loads(row[0])
+
+    def _next_version(self, conn) -> int:
+        # Called inside a write transaction, so the increment is serialized too.
+        return conn.execute("UPDATE seq SET value = value + 1 WHERE name = 'version' RETURNING value").fetchone()[0]
+
+    def _write(self, conn, collection: str, key: str, value) -> None:
+        text = json.dumps(value, ensure_ascii=False)
+        count_bytes('write', 'store', len(text))
+        conn.execute(
+            "INSERT INTO docs (collection, key, value, version) VALUES (?, ?, ?, ?)"
+            " ON CONFLICT (collection, key) DO UPDATE SET value = excluded.value, version = excluded.version",
+            (collection, key, text, self._next_version(conn)),
+        )
+
+    def get(self, collection: str, key: str, default=None):
+        return self._read(self._conn(), collection, key, default)
+
+    def put(self, collection: str, key: str, value) -> None:
+        with self.transaction() as conn:
+            self._write(conn, collection, key, value)
+
+    def insert(self, collection: str, key: str, value) -> bool:
+        """Store ``value`` only if ``key`` is absent. Returns False if it already existed."""
+        with self.transaction() as conn:
+            cur = conn.execute(
+                "INSERT OR IGNORE INTO docs (collection, key, value, version) VALUES (?, ?, ?, ?)",
+                (collection, key, json.dumps(value, ensure_ascii=False), self._next_version(conn)),
+            )
+            return cur.rowcount == 1
+
+    def update(self, collection: str, key: str, fn, default=None):
+        """Atomically replace a document with ``fn(current)`` and return the new value."""
+        with self.transaction() as conn:
+            value = fn(self._read(conn, collection, key, default))
+            self._write(conn, collection, key, value)
+            return value
+
+    def update_many(self, collection: str, fn) -> dict:
+        """Atomically rewrite several documents of one collection.
+
+        ``fn(get)`` reads current documents with ``get(key, default)`` and returns
+        ``{key: new_value}``; a new value of None deletes the document.
+        """
+        with self.transaction() as conn:
+            changes = fn(lambda key, default=None: self._read(conn, collection, key, default))
+            for key, value in changes.items():
+                if value is None:
+                    conn.execute("DELETE FROM docs WHERE collection = ? AND key = ?", (collection, key))
+                else:
+                    self._write(conn, collection, key, value)
+            return changes
+
+    def delete(self, collection: str, key: str) -> None:
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM docs WHERE collection = ? AND key = ?", (collection, key))
+
+    def delete_if(self, collection: str, key: str, predicate) -> bool:
+        """Atomically delete a document if ``predicate(current)`` is true."""
+        with self.transaction() as conn:
+            row = conn.execute(
+                "SELECT value FROM docs WHERE collection = ? AND key = ?", (collection, key)
+            ).fetchone()
+            if row is None or not predicate(json.loads(row[0])):
+                return False
+            conn.execute("DELETE FROM docs WHERE collection = ? AND key = ?", (collection, key))
+            return True
+
+    def scan(self, collection: str, prefix: str):
+        """``(key, value)`` pairs whose key starts with ``prefix``, in key order."""
+        rows = self._conn().execute(
+            "SELECT key, value FROM docs WHERE collection = ? AND key >= ? AND key < ? ORDER BY key",
+            (collection, prefix, prefix + '\U0010ffff'),
+        ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def version(self, collection: str, key: str) -> int:
+        # Taken from the global seq counter on every write (see _write), so a
+        # primary-key lookup is enough to tell whether a cached copy is stale,
+        # even across a delete and re-create. 0 means "no such document".
+        row = self._conn().execute(
+            "SELECT version FROM docs WHERE collection = ? AND key = ?", (collection, key)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def items(self, collection: str):
+        rows = self._conn().execute(
+            "SELECT key, value FROM docs WHERE collection = ? ORDER BY rowid", (collection,)
+        ).fetchall()
+        return [(key, json.loads(value)) for key, value in rows]
+
+    def load_collection(self, collection: str, default):
+        mapping = dict(self.items(collection))
+        if collection == 'users':
+            return list(mapping.values())
+        return mapping or default
+
+    def save_collection(self, collection: str, data) -> None:
+        if collection == 'users':
+            data = _users_to_mapping(data)
+        with self.transaction() as conn:
+            conn.execute("DELETE FROM docs WHERE collection = ?", (collection,))
+            for key, value in data.items():
+                self._write(conn, collection, key, value)
+
+    def migrate_from_json(self, root: str = '.', notes_folder: str = NOTES_FOLDER) -> None:
+        """One-shot import of the legacy JSON files. Existing rows are never overwritten."""
+        with self.transaction() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'json_migrated'").fetchone():
+                return
+            for filename, collection in COLLECTION_FILES.items():
+                data = read_json_file(os.path.join(root, filename), {})
+                if collection == 'users':
+                    data = _users_to_mapping(data)
+                if not isinstance(data, dict):
+                    continue
+                for key, value in data.items():
+                    conn.execute(
+                        "INSERT OR IGNORE INTO docs (collection, key, value, version) VALUES (?, ?, ?, ?)",
+                        (collection, key, json.dumps(value, ensure_ascii=False), self._next_version(conn)),
+                    )
+            if os.path.isdir(notes_folder):
+                for name in os.listdir(notes_folder):
+                    if not name.endswith('_notes.json'):
+                        continue
+                    notes = read_json_file(os.path.join(notes_folder, name), [])
+                    conn.execute(
+                        "INSERT OR IGNORE INTO docs (collection, key, value, version) VALUES (?, ?, ?, ?)",
+                        ('notes', name[:-len('_notes.json')], json.dumps(notes, ensure_ascii=False),
+                         self._next_version(conn)),
+                    )
+            conn.execute("INSERT INTO meta (key, value) VALUES ('json_migrated', ?)",
+                         (datetime.now().isoformat(),))
+
+class JsonStore:
+    """The legacy layout: one ``<collection>.json`` file per collection.
+
+    Kept as a fallback backend (``STUDIST_STORAGE=json``). Writes are atomic
+    (temp file + rename) and read-modify-write cycles are serialized by an
+    in-process lock plus an ``fcntl`` lock file where available.
+    """
+
+    def __init__(self, root: str = '.', notes_folder: str = NOTES_FOLDER):
+        self.root = root
+        self.notes_folder = notes_folder
+        self._lock = threading.RLock()
+        self._held = False
+
+    def _path(self, collection: str) -> str:
+        if collection == 'notes':
+            return self.notes_folder
+        return os.path.join(self.root, f"{collection}.json")
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            if self._held:
+                # Re-entered from the same thread; the file lock is already ours.
+                yield None
+                return
+            with open(os.path.join(self.root, '.studist.lock'), 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                self._held = True
+                try:
+                    yield None
+                finally:
+                    self._held = False
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _read_all(self, collection: str) -> dict:
+        if collection == 'notes':
+            return {}
+        data = read_json_file(self._path(collection), {})
+        if collection == 'users':
+            return _users_to_mapping(data)
+        return data if isinstance(data, dict) else {}
+
+    def _write_all(self, collection: str, mapping: dict) -> None:
+        data = list(mapping.values()) if collection == 'users' else mapping
+        write_json_file(self._path(collection), data)
+
+    def get(self, collection: str, key: str, default=None):
+        if collection == 'notes':
+            return read_json_file(os.path.join(self.notes_folder, f"{key}_notes.json"), copy.deepcopy(default))
+        return copy.deepcopy(self._read_all(collection).get(key, default))
+
+    def put(self, collection: str, key: str, value) -> None:
+        self.update(collection, key, lambda _: value)
+
+    def insert(self, collection: str, key: str, value) -> bool:
+        with self.transaction():
+            if collection != 'notes' and key in self._read_all(collection):
+                return False
+            self.put(collection, key, value)
+            return True
+
+    def update(self, collection: str, key: str, fn, default=None):
+        with self.transaction():
+            if collection == 'notes':
+                value = fn(self.get(collection, key, default))
+                write_json_file(os.path.join(self.notes_folder, f"{key}_notes.json"), value)
+                return value
+            mapping = self._read_all(collection)
+            value = fn(copy.deepcopy(mapping.get(key, default)))
+            mapping[key] = value
+            self._write_all(collection, mapping)
+            return value
+
+    def update_many(self, collection: str, fn) -> dict:
+        with self.transaction():
+            mapping = self._read_all(collection)
+            changes = fn(lambda key, default=None: copy.deepcopy(mapping.get(key, default)))
+            for key, value in changes.items():
+                if value is None:
+                    mapping.pop(key, None)
+                else:
+                    mapping[key] = value
+            self._write_all(collection, mapping)
+            return changes
+
+    def delete(self, collection: str, key: str) -> None:
+        with self.transaction():
+            if collection == 'notes':
+                path = os.path.join(self.notes_folder, f"{key}_notes.json")
+                if os.path.exists(path):
+                    os.remove(path)
+                return
+            mapping = self._read_all(collection)
+            if mapping.pop(key, None) is not None:
+                self._write_all(collection, mapping)
+
+    def delete_if(self, collection: str, key: str, predicate) -> bool:
+        with self.transaction():
+            mapping = self._read_all(collection)
+            if key not in mapping or not predicate(mapping[key]):
+                return False
+            del mapping[key]
+            self._write_all(collection, mapping)
+            return True
+
+    def scan(self, collection: str, prefix: str):
+        return sorted((k, v) for k, v in self._read_all(collection).items() if k.startswith(prefix))
+
+    def items(self, collection: str):
+        return list(self._read_all(collection).items())
+
+    def version(self, collection: str, key: str) -> int:
+        if collection == 'notes':
+            path = os.path.join(self.notes_folder, f"{key}_notes.json")
+        else:
+            path = self._path(collection)
+        try:
+            return os.stat(path).st_mtime_ns
+        except OSError:
+            return 0
+
+    def load_collection(self, collection: str, default):
+        return read_json_file(self._path(collection), default)
+
+    def save_collection(self, collection: str, data) -> None:
+        with self.transaction():
+            write_json_file(self._path(collection), data)
+
+class CachedStore:
+    """Bounded LRU read-through cache in front of a store.
+
+    Parsed documents are kept per worker and revalidated on every hit against the
+    backend's ``version`` (a row counter for SQLite, the file mtime for JSON), which
+    is far cheaper than reading and parsing the document again. Writes made through
+    this object drop the cached entry straight away. Values returned by ``get`` are
+    shared with the cache and must be treated as read-only.
+    """
+
+    def __init__(self, store, maxsize: int = 1024):
+        self.store = store
+        self.maxsize = maxsize
+        self._docs = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __getattr__(self, name):
+        return getattr(self.store, name)
+
+    @instrumented('load_json')
+    def get(self, collection: str, key: str, default=None):
+        version = self.store.version(collection, key)
+        if version == 0:
+            return copy.deepcopy(default)
+        with self._lock:
+            entry = self._docs.get((collection, key))
+            if entry is not None and entry[0] == version:
+                self._docs.move_to_end((collection, key))
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        value = self.store.get(collection, key, default)
+        with self._lock:
+            self._docs[(collection, key)] = (version, value)
+            self._docs.move_to_end((collection, key))
+            while len(self._docs) > self.maxsize:
+                self._docs.popitem(last=False)
+        return value
+
+    def invalidate(self, collection: str, key: str = None) -> None:
+        with self._lock:
+            if key is not None:
+                self._docs.pop((collection, key), None)
+                return
+            for cached in [k for k in self._docs if k[0] == collection]:
+                del self._docs[cached]
+
+    @instrumented('save_json')
+    def put(self, collection: str, key: str, value) -> None:
+        try:
+            self.store.put(collection, key, value)
+        finally:
+            self.invalidate(collection, key)
+
+    @instrumented('save_json')
+    def insert(self, collection: str, key: str, value) -> bool:
+        try:
+            return self.store.insert(collection, key, value)
+        finally:
+            self.invalidate(collection, key)
+
+    @instrumented('save_json')
+    def update(self, collection: str, key: str, fn, default=None):
+        try:
+            return self.store.update(collection, key, fn, default)
+        finally:
+            self.invalidate(collection, key)
+
+    @instrumented('save_json')
+    def update_many(self, collection: str, fn) -> dict:
+        changes = {}
+        def run(get):
+            changes.update(fn(get))
+            return changes
+        try:
+            return self.store.update_many(collection, run)
+        finally:
+            for key in changes:
+                self.invalidate(collection, key)
+
+    @instrumented('save_json')
+    def delete(self, collection: str, key: str) -> None:
+        try:
+            self.store.delete(collection, key)
+        finally:
+            self.invalidate(collection, key)
+
+    @instrumented('save_json')
+    def delete_if(self, collection: str, key: str, predicate) -> bool:
+        try:
+            return self.store.delete_if(collection, key, predicate)
+        finally:
+            self.invalidate(collection, key)
+
+    @instrumented('save_json')
+    def save_collection(self, collection: str, data) -> None:
+        try:
+            self.store.save_collection(collection, data)
+        finally:
+            self.invalidate(collection)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else 0.0,
+                'size': len(self._docs),
+                'maxsize': self.maxsize,
+            }
+
+def create_store(backend: str, path: str):
+    if backend == 'json':
+        return JsonStore(os.path.dirname(path) or '.')
+    store = SqliteStore(path)
+    store.migrate_from_json('.', NOTES_FOLDER)
+    return store
+
+STORE = CachedStore(create_store(app.config['STORAGE_BACKEND'], app.config['STORAGE_PATH']),
+                    maxsize=app.config['DOC_CACHE_SIZE'])
+
+# ---------- Sessions ----------
+class StoreSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+
+class StoreSessionInterface(SessionInterface):
+    """Server-side sessions kept in STORE (``STUDIST_SESSION_BACKEND=store``).
+
+    The cookie only carries a random session id; the data lives in the
+    'sessions' collection, so every worker and host sharing the store sees the
+    same session, and logging out ends it everywhere at once. The default
+    cookie backend also works across workers, provided they all share
+    FLASK_SECRET_KEY, but a copied cookie stays valid until it expires.
+    Expired records are dropped when read and, for sessions never seen again,
+    by a sweep at most every ``purge_interval`` seconds per worker.
+    """
 
-def save_notes(username: str, notes):
-    save_json(user_notes_path(username), notes)
+    purge_interval = 3600
+
+    def __init__(self):
+        self._last_purge = 0.0
+
+    def purge_expired(self) -> None:
+        now = time.time()
+        if now - self._last_purge < self.purge_interval:
+            return
+        self._last_purge = now
+        for sid, record in STORE.items('sessions'):
+            if record['expires'] <= now:
+                STORE.delete_if('sessions', sid, lambda r: r['expires'] <= time.time())
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        if sid:
+            record = STORE.get('sessions', sid)
+            if record is not None and record['expires'] > time.time():
+                return StoreSession(record['data'], sid=sid)
+            if record is not None:
+                STORE.delete_if('sessions', sid, lambda r: r['expires'] <= time.time())
+        return StoreSession(sid=uuid.uuid4().hex + uuid.uuid4().hex, new=True)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if not session:
+            if session.modified and not session.new:
+                STORE.delete('sessions', session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not (session.modified or self.should_set_cookie(app, session)):
+            return
+        lifetime = app.permanent_session_lifetime.total_seconds()
+        STORE.put('sessions', session.sid, {'data': dict(session), 'expires': time.time() + lifetime})
+        if session.new:
+            self.purge_expired()
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+            domain=domain, path=path,
+        )
+
+if app.config['SESSION_BACKEND'] == 'store':
+    app.session_interface = StoreSessionInterface()
+
+@app.route('/cache-stats')
+def cache_stats():
+    stats = STORE.stats()
+    lemmas = cached_lemmas.cache_info()
+    stats['lemmas'] = {'hits': lemmas.hits, 'misses': lemmas.misses,
+                       'size': lemmas.currsize, 'maxsize': lemmas.maxsize}
+    stats['search'] = SEARCH_STORE.stats()
+    return jsonify(stats)
+
+# ---------- Passwords ----------
+class PasswordPool:
+    """Runs password hashing and verification on a small bounded thread pool.
+
+    scrypt is deliberately expensive (~100 ms of CPU per check), so a burst of
+    logins must not occupy every request worker. hashlib.scrypt releases the
+    GIL, so at most ``max_workers`` checks run in parallel; at most
+    ``max_pending`` may be queued or running, and callers beyond that get
+    PasswordPoolBusy straight away instead of piling up behind the queue. A
+    caller that waits longer than ``timeout`` gets PasswordPoolBusy as well.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int, timeout: float):
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(max(self.max_workers, max_pending))
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='password')
+            return self._executor
+
+    def run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise PasswordPoolBusy()
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise PasswordPoolBusy() from None
+
+class PasswordPoolBusy(Exception):
+    pass
+
+PASSWORD_POOL = PasswordPool(
+    max_workers=app.config['PASSWORD_WORKERS'],
+    max_pending=app.config['PASSWORD_MAX_PENDING'],
+    timeout=app.config['PASSWORD_TIMEOUT'],
+)
+
+def hash_password(password: str) -> str:
+    return PASSWORD_POOL.run(generate_password_hash, password, app.config['PASSWORD_HASH_METHOD'])
+
+# Verified against when the username is unknown, so a miss costs the same as a
+# wrong password and response times don't reveal which usernames exist.
+_DUMMY_PASSWORD_HASH = None
+
+def _dummy_password_hash() -> str:
+    global _DUMMY_PASSWORD_HASH
+    if _DUMMY_PASSWORD_HASH is None:
+        _DUMMY_PASSWORD_HASH = generate_password_hash(uuid.uuid4().hex, app.config['PASSWORD_HASH_METHOD'])
+    return _DUMMY_PASSWORD_HASH
+
+def _stored_password_matches(user, password: str) -> bool:
+    if user is None:
+        check_password_hash(_dummy_password_hash(), password)
+        return False
+    if user.get('password_hash'):
+        return check_password_hash(user['password_hash'], password)
+    # Records from before password hashing keep the plaintext in 'password'.
+    stored = user.get('password')
+    return isinstance(stored, str) and hmac.compare_digest(stored.encode('utf-8'), password.encode('utf-8'))
+
+def needs_rehash(user) -> bool:
+    stored = user.get('password_hash')
+    return not stored or not stored.startswith(app.config['PASSWORD_HASH_METHOD'] + '$')
+
+def verify_password(username: str, password: str) -> bool:
+    """Check a login and transparently upgrade plaintext or outdated hashes."""
+    user = STORE.get('users', username)
+    if not PASSWORD_POOL.run(_stored_password_matches, user, password):
+        return False
+    if needs_rehash(user):
+        new_hash = hash_password(password)
+
+        def upgrade(record):
+            # Only replace the credential that was just verified.
+            if record.get('password_hash') == user.get('password_hash') and \
+                    record.get('password') == user.get('password'):
+                record = {k: v for k, v in record.items() if k != 'password'}
+                record['password_hash'] = new_hash
+            return record
+
+        STORE.update('users', username, upgrade, default=dict(user))
+    return True
 
 # ---------- Root/Login/Signup/Logout ----------
 @app.route('/', methods=['GET', 'POST'])
@@ -81,11 +1101,13 @@ def login():
     if request.method == 'POST':
         username = request.form['username'].strip()
         password = request.form['password']
-        users = load_json('users.json', [])
-        for user in users:
-            if user.get('username') == username and user.get('password') == password:
-                session['username'] = username
-                return redirect(f"/dashboard?user={username}")
+        try:
+            ok = verify_password(username, password)
+        except PasswordPoolBusy:
+            return render_template('login.html', error="⏳ Too many sign-ins right now. Please try again."), 503
+        if ok:
+            session['username'] = username
+            return redirect(f"/dashboard?user={username}")
         error = "❌ Invalid username or password. Please try again."
     return render_template('login.html', error=error)
 
@@ -95,12 +1117,16 @@ def signup():
     if request.method == 'POST':
         username = request.form['username'].strip()
         password = request.form['password']
-        users = load_json('users.json', [])
-        if any(u.get('username') == username for u in users):
+        if STORE.get('users', username) is not None:
+            error = "⚠️ Username already exists. Try another one."
+            return render_template('signup.html', error=error)
+        try:
+            password_hash = hash_password(password)
+        except PasswordPoolBusy:
+            return render_template('signup.html', error="⏳ Too many sign-ups right now. Please try again."), 503
+        if not STORE.insert('users', username, {'username': username, 'password_hash': password_hash}):
             error = "⚠️ Username already exists. Try another one."
             return render_template('signup.html', error=error)
-        users.append({'username': username, 'password': password})
-        save_json('users.json', users)
         return redirect('/')
     return render_template('signup.html', error=error)
 
@@ -116,16 +1142,13 @@ def favicon():
 # ---------- Dashboard ----------
 @app.route('/dashboard')
 def dashboard():
-    username = request.args.get('user') or session.get('username')
+    username = current_username()
     if not username:
         return redirect('/login')
-    reminders_db = load_json('reminders.json', {})
-    reminders_raw = reminders_db.get(username, [])
+    reminders_raw = STORE.get('reminders', username, [])
     reminders = [r['title'] if isinstance(r, dict) else str(r) for r in reminders_raw]
-    user_folder = ensure_user_folder(username)
-    uploaded_files = [f for f in sorted(os.listdir(user_folder)) if os.path.isfile(os.path.join(user_folder, f))]
-    sp_conf = load_json('spotify.json', {})
-    spotify_url = sp_conf.get(username, "https://open.spotify.com/embed/playlist/37i9dQZF1DXcBWIGoYBM5M")
+    uploaded_files = [f['name'] for f in list_user_files(username)[0]]
+    spotify_url = STORE.get('spotify', username, "https://open.spotify.com/embed/playlist/37i9dQZF1DXcBWIGoYBM5M")
     daily_quotes = [
         "The secret of getting ahead is getting started. — Mark Twain",
         "Don’t watch the clock; do what it does. Keep going. — Sam Levenson",
@@ -144,13 +1167,11 @@ def dashboard():
 
 # ---------- Notifications (Assignments/Reminders) ----------
 def get_user_assignments(username: str):
-    db = load_json('assignments.json', {})
-    data = db.get(username, [])
+    data = STORE.get('assignments', username, [])
     return [a for a in data if isinstance(a, dict)]
 
 def get_user_reminders(username: str):
-    db = load_json('reminders.json', {})
-    data = db.get(username, [])
+    data = STORE.get('reminders', username, [])
     out = []
     for r in data:
         if isinstance(r, dict):
@@ -159,50 +1180,426 @@ def get_user_reminders(username: str):
             out.append({'title': str(r), 'date': '', 'time': ''})
     return out
 
-@app.route("/notifications_data")
-def notifications_data():
-    username = request.args.get('user') or session.get('username')
-    if not username:
-        return jsonify([])
-    assignments = get_user_assignments(username)
-    reminders = get_user_reminders(username)
-    notifications = []
-    for a in assignments:
+def reminder_visible_at(reminder: dict):
+    """Epoch seconds at which a reminder starts showing, or None for "always"."""
+    date = reminder.get('date') or ''
+    time_ = reminder.get('time') or ''
+    if not date:
+        return None
+    try:
+        return datetime.strptime(f"{date} {time_ or '00:00'}", "%Y-%m-%d %H:%M").timestamp()
+    except Exception:
+        return None
+
+def build_notification_feed(username: str) -> dict:
+    assignments = []
+    for a in get_user_assignments(username):
         title = a.get('subject') or a.get('title') or 'Assignment'
         due = a.get('due_date', '')
         text = f"Assignment: {title}" + (f" (Due {due})" if due else "")
-        notifications.append({
+        assignments.append({
             "type": "assignment",
             "text": text,
             "link": f"/assignments?user={username}"
         })
-    now = datetime.now()
-    for r in reminders:
+    reminders = []
+    for r in get_user_reminders(username):
         title = r.get('title') or 'Reminder'
-        date = r.get('date') or ''
-        time_ = r.get('time') or ''
-        show = True
-        if date:
-            try:
-                dt = datetime.strptime(f"{date} {time_ or '00:00'}", "%Y-%m-%d %H:%M")
-                show = now >= dt
-            except Exception:
-                show = True
-        if show:
-            notifications.append({
+        reminders.append({
+            "visible_at": reminder_visible_at(r),
+            "notification": {
                 "type": "reminder",
                 "text": f"Reminder: {title}",
                 "link": f"/reminders?user={username}"
-            })
-    return jsonify(notifications)
+            }
+        })
+    body = json.dumps([assignments, reminders], sort_keys=True).encode('utf-8')
+    return {
+        'etag': hashlib.sha1(body).hexdigest(),
+        'assignments': assignments,
+        'reminders': reminders,
+    }
+
+def refresh_notifications(username: str) -> dict:
+    """Re-materialize the notification feed; call after any assignment/reminder write."""
+    feed = build_notification_feed(username)
+    STORE.put('notifications', username, feed)
+    NOTIFICATION_HUB.publish(username)
+    schedule_reminders(username, feed)
+    return feed
+
+def get_notification_feed(username: str) -> dict:
+    feed = STORE.get('notifications', username)
+    if feed is None:
+        # Users migrated from JSON have no materialized feed yet.
+        feed = refresh_notifications(username)
+    return feed
+
+def current_notifications(username: str):
+    """Return ``(etag, notifications)`` for what the user should see right now."""
+    feed = get_notification_feed(username)
+    now = time.time()
+    visible = [r['notification'] for r in feed['reminders']
+               if r['visible_at'] is None or r['visible_at'] <= now]
+    # Reminders only ever become visible as time passes, so the feed version plus
+    # the number of visible reminders identifies the response exactly.
+    return f"{feed['etag']}-{len(visible)}", feed['assignments'] + visible
+
+@app.route("/notifications_data")
+def notifications_data():
+    username = current_username()
+    if not username:
+        return jsonify({'error': 'Not logged in'}), 401
+    etag, notifications = current_notifications(username)
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = jsonify(notifications)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+# ---------- Notification push (SSE) ----------
+class NotificationHub:
+    """Wakes the open /notifications/stream connections of one user.
+
+    Each subscriber owns a one-slot queue; ``publish`` drops a token into the
+    queues of that user's subscribers only, so idle users cost nothing. Works
+    with threads as well as gevent/eventlet workers (which patch ``queue``).
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, username: str) -> queue.Queue:
+        q = queue.Queue(maxsize=1)
+        with self._lock:
+            self._subscribers.setdefault(username, set()).add(q)
+        return q
+
+    def unsubscribe(self, username: str, q: queue.Queue) -> None:
+        with self._lock:
+            subscribers = self._subscribers.get(username)
+            if subscribers is not None:
+                subscribers.discard(q)
+                if not subscribers:
+                    del self._subscribers[username]
+
+    def publish(self, username: str) -> None:
+        with self._lock:
+            subscribers = list(self._subscribers.get(username, ()))
+        for q in subscribers:
+            try:
+                q.put_nowait(True)
+            except queue.Full:
+                pass  # Already has a pending wake-up.
+
+    def count(self) -> int:
+        with self._lock:
+            return sum(len(v) for v in self._subscribers.values())
+
+class ReminderScheduler:
+    """Single background thread that publishes reminders when they fall due.
+
+    Due times live in one heap; the thread sleeps until the earliest one instead
+    of every request re-checking every reminder.
+    """
+
+    def __init__(self, hub: NotificationHub):
+        self.hub = hub
+        self._heap = []
+        self._pending = set()
+        self._cond = threading.Condition()
+        self._thread = None
+        self._thread_pid = None
+
+    def schedule(self, when: float, username: str) -> None:
+        with self._cond:
+            if (when, username) in self._pending:
+                return
+            self._pending.add((when, username))
+            heapq.heappush(self._heap, (when, username))
+            if self._thread is None or not self._thread.is_alive() or self._thread_pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name='reminder-scheduler', daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._heap:
+                    self._cond.wait()
+                when, username = self._heap[0]
+                delay = when - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+                heapq.heappop(self._heap)
+                self._pending.discard((when, username))
+            self.hub.publish(username)
+
+NOTIFICATION_HUB = NotificationHub()
+REMINDER_SCHEDULER = ReminderScheduler(NOTIFICATION_HUB)
+SSE_HEARTBEAT_SECONDS = 15
+
+def schedule_reminders(username: str, feed: dict) -> None:
+    if not app.config['NOTIFICATION_PUSH']:
+        # Polling clients pick reminders up on their next fetch; nothing to wake.
+        return
+    now = time.time()
+    for r in feed['reminders']:
+        if r['visible_at'] is not None and r['visible_at'] > now:
+            REMINDER_SCHEDULER.schedule(r['visible_at'], username)
+
+@app.context_processor
+def notification_settings():
+    return {'notification_push': app.config['NOTIFICATION_PUSH']}
+
+@app.route("/notifications/stream")
+def notifications_stream():
+    if not app.config['NOTIFICATION_PUSH']:
+        # A sync worker would be tied up for as long as the tab stays open.
+        return jsonify({'error': 'Push disabled; poll /notifications_data'}), 404
+    username = current_username()
+    if not username:
+        return jsonify({'error': 'Not logged in'}), 401
+    last_etag = request.headers.get('Last-Event-ID')
+    q = NOTIFICATION_HUB.subscribe(username)
+    schedule_reminders(username, get_notification_feed(username))
+
+    def events():
+        nonlocal last_etag
+        try:
+            yield f"retry: {SSE_HEARTBEAT_SECONDS * 1000}\n\n"
+            while True:
+                etag, notifications = current_notifications(username)
+                if etag != last_etag:
+                    last_etag = etag
+                    yield f"id: {etag}\ndata: {json.dumps(notifications, ensure_ascii=False)}\n\n"
+                try:
+                    q.get(timeout=SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # Heartbeat; the loop also re-checks the feed, which picks up
+                    # writes made by other worker processes.
+                    yield ": ping\n\n"
+        finally:
+            NOTIFICATION_HUB.unsubscribe(username, q)
+
+    response = app.response_class(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+# ---------- Upload Blob Store ----------
+# Uploaded files are stored once per distinct content under BLOB_FOLDER, named by
+# their sha256. A user's uploads/<username>/<filename> is a hard link to the blob,
+# so duplicate PDFs cost no extra disk and every existing reader of the user
+# folder keeps working. STORE collection 'files' is the per-user manifest,
+# username -> {filename: {'sha256', 'size', 'mtime', 'pages'}}, kept up to date
+# on upload and delete so listings never touch the filesystem.
+def blob_path(digest: str) -> str:
+    return os.path.join(BLOB_FOLDER, digest[:2], digest)
+
+def blob_tmp_path() -> str:
+    return os.path.join(BLOB_FOLDER, 'tmp', uuid.uuid4().hex)
+
+def copy_stream(stream, f, hasher=None) -> int:
+    size = 0
+    while True:
+        chunk = stream.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        f.write(chunk)
+        if hasher is not None:
+            hasher.update(chunk)
+        size += len(chunk)
+    count_bytes('write', 'upload', size)
+    return size
+
+def hash_file(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(UPLOAD_CHUNK_SIZE), b''):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+def add_user_file(username: str, filename: str, tmp_path: str, digest: str, size: int) -> dict:
+    """Move a fully written temp file into the blob store and link it into the user folder."""
+    dest = os.path.join(ensure_user_folder(username), filename)
+    path = blob_path(digest)
+    # Prepare the user's link before taking the lock; the copy fallback can be slow.
+    link_tmp = blob_tmp_path()
+    try:
+        try:
+            os.link(tmp_path, link_tmp)
+            hard_links = True
+        except OSError:
+            shutil.copyfile(tmp_path, link_tmp)  # No hard links here: store a private copy.
+            hard_links = False
+        # STORE.transaction serializes blob create/release across workers; only
+        # renames and links happen while it is held.
+        with STORE.transaction():
+            if os.path.exists(path):
+                os.remove(tmp_path)
+                if hard_links:
+                    os.remove(link_tmp)
+                    os.link(path, link_tmp)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            # Re-uploading the same content: dest already is a link to the blob, and
+            # renaming a second link over it would be a no-op that leaks the temp link.
+            if not (os.path.exists(dest) and os.path.samefile(link_tmp, dest)):
+                os.replace(link_tmp, dest)
+    finally:
+        if os.path.exists(link_tmp):
+            os.remove(link_tmp)
+    meta = {'sha256': digest, 'size': size, 'mtime': time.time()}
+    previous = {}
+    def set_file(files):
+        files = seed_manifest(username, files)
+        previous.update(files.get(filename) or {})
+        files[filename] = meta
+        return files
+    STORE.update('files', username, set_file)
+    if previous.get('sha256') and previous['sha256'] != digest:
+        release_blob(previous['sha256'])
+    if filename.lower().endswith('.pdf'):
+        record_page_count(username, filename, digest)
+    index_file_async(username, filename)
+    return meta
+
+def release_blob(digest: str) -> None:
+    with STORE.transaction():
+        try:
+            if os.stat(blob_path(digest)).st_nlink <= 1:
+                os.remove(blob_path(digest))
+        except FileNotFoundError:
+            pass
+
+def purge_stale_uploads() -> None:
+    """Remove temp files and resumable uploads left behind by crashed or abandoned uploads."""
+    cutoff = time.time() - app.config['UPLOAD_STALE_SECONDS']
+    for folder in ('tmp', 'partial'):
+        for entry in os.scandir(os.path.join(BLOB_FOLDER, folder)):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    if folder == 'partial':
+                        STORE.delete('upload_sessions', entry.name)
+            except FileNotFoundError:
+                pass  # Finished or purged by another worker meanwhile.
+
+def store_upload(stream, username: str, filename: str) -> dict:
+    """Stream an upload to disk in chunks, hashing as it is written."""
+    purge_stale_uploads()
+    tmp_path = blob_tmp_path()
+    hasher = hashlib.sha256()
+    try:
+        with open(tmp_path, 'wb') as f:
+            size = copy_stream(stream, f, hasher)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return add_user_file(username, filename, tmp_path, hasher.hexdigest(), size)
+
+def remove_user_file(username: str, filename: str) -> None:
+    path = safe_join(ensure_user_folder(username), filename)
+    if path is None:
+        raise ValueError(f"invalid filename: {filename!r}")
+    if os.path.exists(path):
+        os.remove(path)
+    removed = {}
+    def drop_file(files):
+        files = seed_manifest(username, files)
+        removed.update(files.pop(filename, None) or {})
+        return files
+    STORE.update('files', username, drop_file)
+    if removed.get('sha256'):
+        release_blob(removed['sha256'])
+    reindex_async(username, [f"file:{filename}"])
+
+# ---------- Upload Manifest ----------
+FILE_SORT_KEYS = {
+    'name': lambda item: item[0].lower(),
+    'size': lambda item: item[1].get('size', 0),
+    'mtime': lambda item: item[1].get('mtime', 0),
+}
+
+def scan_user_folder(username: str) -> dict:
+    """Manifest entries for files already on disk (hashes are filled in lazily)."""
+    user_folder = os.path.join(app.config['UPLOAD_FOLDER'], username)
+    files = {}
+    if os.path.isdir(user_folder):
+        for entry in os.scandir(user_folder):
+            if entry.is_file():
+                st = entry.stat()
+                files[entry.name] = {'sha256': None, 'size': st.st_size, 'mtime': st.st_mtime}
+    return files
+
+def seed_manifest(username: str, files):
+    # Users with uploads from before the manifest get it built from one scan.
+    return scan_user_folder(username) if files is None else files
+
+def get_manifest(username: str) -> dict:
+    files = STORE.get('files', username)
+    if files is None:
+        files = STORE.update('files', username, lambda current: seed_manifest(username, current))
+    return files
+
+def list_user_files(username: str, sort: str = 'name', order: str = 'asc', page: int = 1, per_page: int = 0):
+    """Sorted, optionally paginated ``(entries, total)``; entries are meta dicts plus 'name'."""
+    items = sorted(get_manifest(username).items(), key=FILE_SORT_KEYS.get(sort, FILE_SORT_KEYS['name']),
+                   reverse=(order == 'desc'))
+    total = len(items)
+    if per_page > 0:
+        items = items[(page - 1) * per_page:page * per_page]
+    return [dict(meta, name=name) for name, meta in items], total
+
+def set_manifest_pages(username: str, filename: str, digest: str, pages: int) -> None:
+    def set_pages(files):
+        if (files or {}).get(filename, {}).get('sha256') == digest:
+            files[filename]['pages'] = pages
+        return files
+    STORE.update('files', username, set_pages)
+
+def record_page_count(username: str, filename: str, digest: str) -> None:
+    """Store a PDF's page count in the manifest, counting it in the render pool if new."""
+    pages = STORE.get('pdf_pages', digest)
+    if pages is not None:
+        set_manifest_pages(username, filename, digest, pages)
+        return
+    def done(future):
+        if future.exception() is not None:
+            return  # Rendering unavailable; the count stays unknown.
+        STORE.put('pdf_pages', digest, future.result())
+        set_manifest_pages(username, filename, digest, future.result())
+    path = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], username, filename))
+    try:
+        render_pool().submit(pdf_render.count_pdf_pages, path).add_done_callback(done)
+    except Exception:
+        pass  # Best effort: the upload itself has already succeeded.
+
+@app.route('/files')
+def user_files():
+    username = current_username()
+    if not username:
+        return jsonify({'error': 'Not logged in'}), 401
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 50, type=int), 1), 500)
+    files, total = list_user_files(username, request.args.get('sort', 'name'),
+                                   request.args.get('order', 'asc'), page, per_page)
+    return jsonify({'files': files, 'total': total, 'page': page, 'per_page': per_page})
 
 # ---------- Uploads ----------
 @app.route('/upload', methods=['GET', 'POST'])
 def upload():
-    username = request.args.get('user') or session.get('username')
+    username = current_username()
     if not username:
         return redirect('/')
-    user_folder = ensure_user_folder(username)
     if request.method == 'POST':
         if 'file' not in request.files:
             return "No file part"
@@ -210,188 +1607,1010 @@ def upload():
         if file.filename == '':
             return "No selected file"
         if allowed(file.filename, ALLOWED_DOC_EXTS):
-            file.save(os.path.join(user_folder, secure_filename(file.filename)))
+            store_upload(file.stream, username, secure_filename(file.filename))
             return redirect(f"/upload?user={username}")
         return "File type not allowed"
-    files = [f for f in os.listdir(user_folder) if os.path.isfile(os.path.join(user_folder, f))]
-    return render_template('upload.html', username=username, files=files)
+    sort = request.args.get('sort', 'name')
+    order = request.args.get('order', 'asc')
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = app.config['FILES_PER_PAGE']
+    entries, total = list_user_files(username, sort, order, page, per_page)
+    return render_template('upload.html', username=username, files=[f['name'] for f in entries],
+                           file_meta={f['name']: f for f in entries}, sort=sort, order=order,
+                           page=page, pages=max((total + per_page - 1) // per_page, 1))
+
+@app.route('/upload-stream/<username>/<filename>', methods=['PUT'])
+def upload_stream(username, filename):
+    # Raw request body, streamed straight to disk (no multipart parsing).
+    username = current_username(username)
+    if not username:
+        return jsonify({'error': 'Not logged in'}), 401
+    filename = secure_filename(filename)
+    if not allowed(filename, ALLOWED_DOC_EXTS):
+        return jsonify({'error': 'File type not allowed'}), 400
+    meta = store_upload(request.stream, username, filename)
+    return jsonify(dict(meta, filename=filename)), 201
+
+# Resumable chunked uploads for large files: create a session, PUT chunks with an
+# Upload-Offset header (the current offset is always available from GET), and
+# the file is committed to the blob store when the last byte arrives.
+def upload_partial_path(upload_id: str) -> str:
+    return os.path.join(BLOB_FOLDER, 'partial', upload_id)
+
+def upload_session_json(upload_id: str, upload_session: dict) -> dict:
+    path = upload_partial_path(upload_id)
+    offset = os.path.getsize(path) if os.path.exists(path) else upload_session['size']
+    return {'upload_id': upload_id, 'filename': upload_session['filename'],
+            'size': upload_session['size'], 'offset': offset}
+
+@app.route('/upload-sessions', methods=['POST'])
+def create_upload_session():
+    data = request.json or {}
+    username = current_username(data.get('username'))
+    if not username:
+        return jsonify({'error': 'Not logged in'}), 401
+    filename = secure_filename(data.get('filename') or '')
+    size = data.get('size')
+    if not filename or not isinstance(size, int) or size < 0:
+        return jsonify({'error': 'filename and size are required'}), 400
+    if not allowed(filename, ALLOWED_DOC_EXTS):
+        return jsonify({'error': 'File type not allowed'}), 400
+    if size > app.config['MAX_UPLOAD_SIZE']:
+        return jsonify({'error': 'File too large'}), 413
+    purge_stale_uploads()
+    upload_id = uuid.uuid4().hex
+    upload_session = {'username': username, 'filename': filename, 'size': size, 'created': time.time()}
+    open(upload_partial_path(upload_id), 'wb').close()
+    STORE.put('upload_sessions', upload_id, upload_session)
+    return jsonify(upload_session_json(upload_id, upload_session)), 201
+
+@app.route('/upload-sessions/<upload_id>', methods=['GET', 'PUT'])
+def upload_session_chunk(upload_id):
+    upload_session = STORE.get('upload_sessions', upload_id)
+    if upload_session is None:
+        return jsonify({'error': 'Unknown upload'}), 404
+    if not current_username(upload_session['username']):
+        return jsonify({'error': 'Not logged in'}), 401
+    if request.method == 'GET':
+        return jsonify(upload_session_json(upload_id, upload_session))
+    path = upload_partial_path(upload_id)
+    with open(path, 'ab') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)  # One writer per session; released on close.
+        offset = f.seek(0, os.SEEK_END)
+        if request.headers.get('Upload-Offset', type=int) != offset:
+            return jsonify(dict(upload_session_json(upload_id, upload_session),
+                                error='Offset mismatch')), 409
+        offset += copy_stream(request.stream, f)
+    if offset > upload_session['size']:
+        os.remove(path)
+        STORE.delete('upload_sessions', upload_id)
+        return jsonify({'error': 'Upload exceeds declared size'}), 400
+    if offset < upload_session['size']:
+        return jsonify(upload_session_json(upload_id, upload_session))
+    meta = add_user_file(upload_session['username'], upload_session['filename'], path, hash_file(path), offset)
+    STORE.delete('upload_sessions', upload_id)
+    return jsonify(dict(meta, filename=upload_session['filename'], done=True)), 201
+
+def send_stored_file(path: str, etag: str):
+    """Serve a stored file with a strong ETag and byte-range support.
+
+    With SENDFILE_MODE 'x-sendfile' Flask hands the body to the front proxy;
+    with 'x-accel' nginx serves it from an internal location mapped onto
+    SENDFILE_ROOT at X_ACCEL_PREFIX (and handles ranges itself).
+    """
+    path = os.path.abspath(path)
+    if app.config['SENDFILE_MODE'] == 'x-accel':
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            response = app.response_class(mimetype=mimetypes.guess_type(path)[0]
+                                          or 'application/octet-stream')
+            relative = os.path.relpath(path, app.config['SENDFILE_ROOT']).replace(os.sep, '/')
+            response.headers['X-Accel-Redirect'] = f"{app.config['X_ACCEL_PREFIX']}/{relative}"
+        response.set_etag(etag)
+    else:
+        response = send_file(path, conditional=True, etag=etag)
+    response.cache_control.no_cache = True  # Revalidate; unchanged files get a 304.
+    return response
 
 @app.route('/uploads/<username>/<filename>')
 def uploaded_file(username, filename):
-    user_folder = ensure_user_folder(username)
-    return send_from_directory(user_folder, filename)
+    username = current_username(username)
+    if not username:
+        return redirect('/')
+    path = safe_join(app.config['UPLOAD_FOLDER'], username, filename)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+    return send_stored_file(path, user_file_digest(username, filename))
 
 @app.route('/delete-file', methods=['POST'])
 def delete_file():
-    username = request.form['username']
-    filename = request.form['filename']
-    path = os.path.join(ensure_user_folder(username), filename)
-    if os.path.exists(path):
-        os.remove(path)
+    username = current_username(request.form.get('username'))
+    if not username:
+        return redirect('/')
+    filename = request.form.get('filename', '')
+    # Stored names always went through secure_filename; anything else (a path) is refused.
+    if not filename or secure_filename(filename) != filename:
+        return "Invalid filename", 400
+    remove_user_file(username, filename)
     return redirect(f"/upload?user={username}")
 
+# ---------- PDF Page Rendering ----------
+PAGE_DPI_DEFAULT = 110
+PAGE_DPI_MIN = 36
+PAGE_DPI_MAX = 300
+THUMBNAIL_DPI = 48
+THUMBNAIL_WIDTH = 200
+
+_render_pool = None
+_render_pool_pid = None
+_render_pool_lock = threading.Lock()
+
+def render_pool() -> ProcessPoolExecutor:
+    # Spawned (not forked) workers: they import only pdf_render (see the main
+    # block for `python app.py`), and forking a process that already runs threads
+    # is unsafe.
+    global _render_pool, _render_pool_pid
+    with _render_pool_lock:
+        if _render_pool is None or _render_pool_pid != os.getpid():
+            _render_pool = ProcessPoolExecutor(max_workers=app.config['RENDER_WORKERS'],
+                                               mp_context=multiprocessing.get_context('spawn'))
+            _render_pool_pid = os.getpid()
+        return _render_pool
+
+def user_file_digest(username: str, filename: str):
+    """sha256 of a user's file from the 'files' records, hashing files uploaded before them."""
+    meta = get_manifest(username).get(filename)
+    if meta is None:
+        return None
+    if meta.get('sha256'):
+        return meta['sha256']
+    digest = hash_file(os.path.join(app.config['UPLOAD_FOLDER'], username, filename))
+    def set_digest(files):
+        if filename in files:
+            files[filename]['sha256'] = digest
+        return files
+    STORE.update('files', username, set_digest)
+    return digest
+
+class PageCache:
+    """Rendered page PNGs on disk, named by file hash, page, DPI and thumbnail size.
+
+    Files are touched on every hit; once the folder grows past ``max_bytes`` the
+    least recently used ones are removed. Identical renders in flight in this
+    worker are shared.
+    """
+
+    def __init__(self, folder: str, max_bytes: int):
+        self.folder = os.path.abspath(folder)
+        self.max_bytes = max_bytes
+        self._total = None
+        self._inflight = {}
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def path(self, digest: str, page: int, dpi: int, thumbnail_width=None) -> str:
+        suffix = f"-t{thumbnail_width}" if thumbnail_width else ''
+        return os.path.join(self.folder, f"{digest}-p{page}-d{dpi}{suffix}.png")
+
+    def get_or_render(self, digest: str, pdf_path: str, page: int, dpi: int, thumbnail_width=None) -> str:
+        path = self.path(digest, page, dpi, thumbnail_width)
+        try:
+            os.utime(path)
+            return path
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            future = self._inflight.get(path)
+            if future is None:
+                future = self._inflight[path] = render_pool().submit(
+                    pdf_render.render_pdf_page, pdf_path, page, dpi, path, thumbnail_width)
+                future.add_done_callback(lambda f, path=path: self._rendered(path, f))
+        with span('render_pdf_page'):
+            future.result(timeout=app.config['RENDER_TIMEOUT'])
+        return path
+
+    def _rendered(self, path: str, future) -> None:
+        with self._lock:
+            self._inflight.pop(path, None)
+        if future.exception() is None and os.path.exists(path):
+            self._added(os.path.getsize(path))
+
+    def _scan(self):
+        entries = []
+        for name in os.listdir(self.folder):
+            try:
+                st = os.stat(os.path.join(self.folder, name))
+            except FileNotFoundError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        return entries
+
+    def _added(self, size: int) -> None:
+        with self._lock:
+            if self._total is None:
+                self._total = sum(e[1] for e in self._scan())
+            else:
+                self._total += size
+            if self._total <= self.max_bytes:
+                return
+            # Rescan: other workers share the folder, so our running total drifts.
+            entries = sorted(self._scan())
+            self._total = sum(e[1] for e in entries)
+            for _, entry_size, name in entries:
+                if self._total <= self.max_bytes * 0.9:
+                    break
+                try:
+                    os.remove(os.path.join(self.folder, name))
+                except FileNotFoundError:
+                    pass
+                self._total -= entry_size
+
+PAGE_CACHE = PageCache(os.path.join(GENERATED_FOLDER, 'pages'), app.config['PAGE_CACHE_MAX_BYTES'])
+
+def pdf_page_count(digest: str, pdf_path: str) -> int:
+    pages = STORE.get('pdf_pages', digest)
+    if pages is None:
+        with span('count_pdf_pages'):
+            pages = render_pool().submit(pdf_render.count_pdf_pages, pdf_path).result(
+                timeout=app.config['RENDER_TIMEOUT'])
+        STORE.put('pdf_pages', digest, pages)
+    return pages
+
+def render_page_response(username: str, filename: str, page: int, dpi: int, thumbnail_width=None):
+    if not filename.lower().endswith('.pdf'):
+        return jsonify({'error': 'Not a PDF'}), 400
+    digest = user_file_digest(username, filename)
+    if digest is None:
+        return jsonify({'error': 'File not found'}), 404
+    pdf_path = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], username, filename))
+    try:
+        if not 1 <= page <= pdf_page_count(digest, pdf_path):
+            return jsonify({'error': 'Page out of range'}), 404
+        path = PAGE_CACHE.get_or_render(digest, pdf_path, page, dpi, thumbnail_width)
+    except Exception as e:
+        return jsonify({'error': f'PDF rendering unavailable: {e}'}), 503
+    return send_file(os.path.abspath(path), mimetype='image/png')
+
+@app.route('/pages/<username>/<filename>')
+def pdf_pages_info(username, filename):
+    username = current_username(username)
+    if not username:
+        return jsonify({'error': 'Not logged in'}), 401
+    digest = user_file_digest(username, filename)
+    if digest is None or not filename.lower().endswith('.pdf'):
+        return jsonify({'error': 'File not found'}), 404
+    pdf_path = os.path.abspath(os.path.join(app.config['UPLOAD_FOLDER'], username, filename))
+    try:
+        pages = pdf_page_count(digest, pdf_path)
+    except Exception as e:
+        return jsonify({'error': f'PDF rendering unavailable: {e}'}), 503
+    return jsonify({'pages': pages, 'sha256': digest})
+
+@app.route('/pages/<username>/<filename>/<int:page>')
+def pdf_page(username, filename, page):
+    username = current_username(username)
+    if not username:
+        return jsonify({'error': 'Not logged in'}), 401
+    dpi = min(max(request.args.get('dpi', PAGE_DPI_DEFAULT, type=int), PAGE_DPI_MIN), PAGE_DPI_MAX)
+    return render_page_response(username, filename, page, dpi)
+
+@app.route('/thumbnails/<username>/<filename>/<int:page>')
+def pdf_thumbnail(username, filename, page):
+    username = current_username(username)
+    if not username:
+        return jsonify({'error': 'Not logged in'}), 401
+    return render_page_response(username, filename, page, THUMBNAIL_DPI, THUMBNAIL_WIDTH)
+
 # ---------- Bookmarks ----------
+class BookmarkBuffer:
+    """Write-behind buffer for PDF reading positions.
+
+    The viewer reports its position on every page turn. Updates are kept in
+    memory per (user, file), so a burst of page turns collapses into the latest
+    position, and a background thread writes each user's pending positions in
+    one store update every ``interval`` seconds (and at shutdown). Reads merge
+    the pending positions over the stored ones, so this worker always sees its
+    own latest writes; other gunicorn workers see them after the next flush.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._pending = {}  # username -> {filename: position}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def set(self, username: str, filename: str, position) -> None:
+        with self._lock:
+            self._pending.setdefault(username, {})[filename] = position
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='bookmark-flush', daemon=True)
+                self._thread.start()
+
+    def get(self, username: str) -> dict:
+        bookmarks = dict(STORE.get('bookmarks', username, {}))
+        with self._lock:
+            bookmarks.update(self._pending.get(username, {}))
+        return bookmarks
+
+    def flush(self) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for username, positions in pending.items():
+            try:
+                STORE.update('bookmarks', username, lambda bookmarks: {**bookmarks, **positions}, {})
+            except Exception:
+                # Put them back for the next flush unless newer positions arrived meanwhile.
+                with self._lock:
+                    self._pending[username] = {**positions, **self._pending.get(username, {})}
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+BOOKMARKS = BookmarkBuffer(app.config['BOOKMARK_FLUSH_SECONDS'])
+atexit.register(BOOKMARKS.flush)
+
 @app.route('/save-bookmark', methods=['POST'])
 def save_bookmark():
-    username = request.json['username']
+    username = current_username(request.json.get('username'))
+    if not username:
+        return jsonify({'error': 'Not logged in'}), 401
     filename = request.json['filename']
     position = request.json['position']
-    data = load_json('bookmarks.json', {})
-    data.setdefault(username, {})[filename] = position
-    save_json('bookmarks.json', data)
+    BOOKMARKS.set(username, filename, position)
     return jsonify({'message': 'Bookmark saved'})
 
 @app.route('/load-bookmark/<username>/<filename>')
 def load_bookmark(username, filename):
-    data = load_json('bookmarks.json', {})
-    return jsonify({'position': data.get(username, {}).get(filename, 0)})
+    username = current_username(username)
+    if not username:
+        return jsonify({'error': 'Not logged in'}), 401
+    return jsonify({'position': BOOKMARKS.get(username).get(filename, 0)})
+
+@app.route('/load-bookmarks')
+def load_bookmarks():
+    """All of a user's positions in one call, {filename: position}."""
+    username = current_username()
+    if not username:
+        return jsonify({'error': 'Not logged in'}), 401
+    return jsonify(BOOKMARKS.get(username))
+
+# ---------- Reminder/Assignment Items ----------
+# Reminders and assignments are per-user lists whose items carry a stable 'id'.
+# Changes go through apply_item_batch(), which applies a list of operations in
+# one store transaction, so checking off ten assignments is one write instead
+# of ten full rewrites.
+ITEM_FIELDS = {
+    'reminders': {'title': str, 'date': str, 'time': str},
+    'assignments': {'subject': str, 'due_date': str, 'description': str, 'completed': bool},
+}
+
+class BatchError(Exception):
+    def __init__(self, message: str, status: int = 400):
+        super().__init__(message)
+        self.status = status
+
+def new_item_id() -> str:
+    return uuid.uuid4().hex[:12]
+
+def _legacy_item(collection: str, item) -> dict:
+    if isinstance(item, dict):
+        return dict(item)
+    if collection == 'reminders':
+        return {'title': str(item), 'date': '', 'time': ''}
+    return {'subject': str(item), 'due_date': '', 'description': '', 'completed': False}
+
+def load_items(collection: str, username: str) -> list:
+    """A user's reminders or assignments, giving items saved before IDs one."""
+    items = STORE.get(collection, username, [])
+    if all(isinstance(item, dict) and item.get('id') for item in items):
+        return items
+    def assign(current):
+        out = []
+        for item in current:
+            item = _legacy_item(collection, item)
+            if not item.get('id'):
+                item['id'] = new_item_id()
+            out.append(item)
+        return out
+
+    return STORE.update(collection, username, assign, [])
+
+def parse_item_operations(collection: str, operations) -> list:
+    """Validate a batch: [{"op": "add"|"update"|"delete", "id"?, ...fields}]."""
+    if not isinstance(operations, list) or not operations:
+        raise BatchError('operations must be a non-empty list')
+    fields = ITEM_FIELDS[collection]
+    parsed = []
+    for i, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in ('add', 'update', 'delete'):
+            raise BatchError(f"operation {i}: op must be add, update or delete")
+        op = operation['op']
+        if op != 'add' and not isinstance(operation.get('id'), str):
+            raise BatchError(f"operation {i}: id is required")
+        values = {}
+        if op != 'delete':
+            for name, kind in fields.items():
+                if name not in operation:
+                    continue
+                value = operation[name]
+                if not isinstance(value, kind):
+                    raise BatchError(f"operation {i}: {name} must be a {'string' if kind is str else 'boolean'}")
+                values[name] = value.strip() if kind is str else value
+        if op == 'add':
+            values = {name: kind() for name, kind in fields.items()} | values
+        parsed.append({'op': op, 'id': operation.get('id'), 'values': values})
+    return parsed
+
+def apply_item_batch(collection: str, username: str, operations: list) -> list:
+    """Apply parsed operations atomically; all or nothing. Returns per-operation results."""
+    load_items(collection, username)
+    results = []
+    touched = {}
+
+    def apply(items):
+        results.clear()
+        touched.clear()
+        position = {item['id']: i for i, item in enumerate(items)}
+        deleted = set()
+        added = []
+        for n, operation in enumerate(operations):
+            if operation['op'] == 'add':
+                item = dict(operation['values'], id=new_item_id())
+                added.append(item)
+                position[item['id']] = None
+                touched[item['id']] = item
+                results.append({'op': 'add', 'id': item['id']})
+                continue
+            item_id = operation['id']
+            if item_id not in position or item_id in deleted:
+                raise BatchError(f"operation {n}: no item with id {item_id!r}", 404)
+            item = touched.get(item_id) or items[position[item_id]]
+            if operation['op'] == 'delete':
+                deleted.add(item_id)
+                touched[item_id] = None
+            else:
+                item.update(operation['values'])
+                touched[item_id] = item
+            results.append({'op': operation['op'], 'id': item_id})
+        kept = [item for item in items if item['id'] not in deleted]
+        return kept + [item for item in added if item['id'] not in deleted]
+
+    STORE.update(collection, username, apply, [])
+    refresh_notifications(username)
+    if collection == 'assignments':
+        reindex_async(username, [f"assignment:{i}" for i in touched])
+    return results
+
+def item_batch_response(collection: str):
+    username = current_username()
+    if not username:
+        return jsonify({'error': 'Not logged in'}), 401
+    if request.method == 'GET':
+        return jsonify(load_items(collection, username))
+    try:
+        operations = parse_item_operations(collection, (request.get_json(silent=True) or {}).get('operations'))
+        results = apply_item_batch(collection, username, operations)
+    except BatchError as e:
+        return jsonify({'error': str(e)}), e.status
+    return jsonify({'results': results})
+
+@app.route('/api/reminders', methods=['GET', 'POST'])
+def reminders_api():
+    return item_batch_response('reminders')
+
+@app.route('/api/assignments', methods=['GET', 'POST'])
+def assignments_api():
+    return item_batch_response('assignments')
+
+def find_item_id(collection: str, username: str, field: str, value):
+    """Legacy lookup for clients that still address items by title/subject."""
+    for item in load_items(collection, username):
+        if item.get(field) == value:
+            return item['id']
+    return None
 
 # ---------- Reminders ----------
 @app.route('/reminders')
 def view_reminders():
-    username = request.args.get('user') or session.get('username')
+    username = current_username()
     if not username:
         return redirect('/')
-    data = load_json('reminders.json', {})
+    reminders = load_items('reminders', username)
     if request.args.get('json'):
-        return jsonify(data.get(username, []))
-    return render_template('reminder.html', username=username, reminders=data.get(username, []))
+        return jsonify(reminders)
+    return render_template('reminder.html', username=username, reminders=reminders)
 
 @app.route('/add-reminder', methods=['GET', 'POST'])
 def add_reminder():
-    username = request.args.get('user') or session.get('username')
+    username = current_username()
     if not username:
         return redirect('/')
     if request.method == 'POST':
-        title = request.form.get('title', '').strip()
-        date = request.form.get('date', '')
-        time_ = request.form.get('time', '')
-        data = load_json('reminders.json', {})
-        data.setdefault(username, []).append({'title': title, 'date': date, 'time': time_})
-        save_json('reminders.json', data)
+        apply_item_batch('reminders', username, parse_item_operations('reminders', [{
+            'op': 'add',
+            'title': request.form.get('title', ''),
+            'date': request.form.get('date', ''),
+            'time': request.form.get('time', ''),
+        }]))
         return redirect(f"/reminders?user={username}")
     return render_template('add_reminder.html', username=username)
 
 @app.route('/delete-reminder', methods=['POST'])
 def delete_reminder():
-    username = request.form.get('username')
-    title = request.form.get('title')
-    data = load_json('reminders.json', {})
-    data[username] = [r for r in data.get(username, []) if r.get('title') != title]
-    save_json('reminders.json', data)
+    username = current_username(request.form.get('username'))
+    if not username:
+        return redirect('/')
+    item_id = request.form.get('id') or find_item_id('reminders', username, 'title', request.form.get('title'))
+    if item_id:
+        try:
+            apply_item_batch('reminders', username, [{'op': 'delete', 'id': item_id, 'values': {}}])
+        except BatchError:
+            pass  # Already gone (e.g. deleted in another tab).
     return redirect(f"/reminders?user={username}")
 
 # ---------- Assignments ----------
 @app.route('/assignments')
 def assignments():
-    username = request.args.get('user') or session.get('username')
+    username = current_username()
     if not username:
         return redirect('/')
-    data = load_json('assignments.json', {})
-    return render_template('assignments.html', username=username, assignments=data.get(username, []))
+    return render_template('assignments.html', username=username,
+                           assignments=load_items('assignments', username))
 
 @app.route('/add-assignment', methods=['GET', 'POST'])
 def add_assignment():
-    username = request.args.get('user') or session.get('username')
+    username = current_username()
     if not username:
         return redirect('/')
     if request.method == 'POST':
-        subject = request.form['subject'].strip()
-        due_date = request.form['due_date']
-        description = request.form['description'].strip()
-        data = load_json('assignments.json', {})
-        data.setdefault(username, []).append({
-            'subject': subject,
-            'due_date': due_date,
-            'description': description,
-            'completed': False
-        })
-        save_json('assignments.json', data)
+        apply_item_batch('assignments', username, parse_item_operations('assignments', [{
+            'op': 'add',
+            'subject': request.form['subject'],
+            'due_date': request.form['due_date'],
+            'description': request.form['description'],
+            'completed': False,
+        }]))
         return redirect(f"/assignments?user={username}")
     return render_template('add_assignment.html', username=username)
 
 @app.route('/update-assignment', methods=['POST'])
 def update_assignment():
-    username = request.json['username']
-    subject = request.json['subject']
-    status = bool(request.json['completed'])
-    data = load_json('assignments.json', {})
-    for a in data.get(username, []):
-        if a.get('subject') == subject:
-            a['completed'] = status
-            break
-    save_json('assignments.json', data)
+    username = current_username(request.json.get('username'))
+    if not username:
+        return jsonify({'error': 'Not logged in'}), 401
+    completed = request.json.get('completed')
+    if not isinstance(completed, bool):
+        return jsonify({'error': 'completed must be a boolean'}), 400
+    item_id = request.json.get('id') or find_item_id('assignments', username, 'subject', request.json.get('subject'))
+    if not item_id:
+        return jsonify({'error': 'Assignment not found'}), 404
+    try:
+        apply_item_batch('assignments', username, [
+            {'op': 'update', 'id': item_id, 'values': {'completed': completed}}])
+    except BatchError as e:
+        return jsonify({'error': str(e)}), e.status
     return jsonify({'message': 'Assignment status updated'})
 
 @app.route('/delete-assignment', methods=['POST'])
 def delete_assignment():
-    username = request.json['username']
-    subject = request.json['subject']
-    data = load_json('assignments.json', {})
-    data[username] = [a for a in data.get(username, []) if a.get('subject') != subject]
-    save_json('assignments.json', data)
+    username = current_username(request.json.get('username'))
+    if not username:
+        return jsonify({'error': 'Not logged in'}), 401
+    item_id = request.json.get('id') or find_item_id('assignments', username, 'subject', request.json.get('subject'))
+    if not item_id:
+        return jsonify({'error': 'Assignment not found'}), 404
+    try:
+        apply_item_batch('assignments', username, [{'op': 'delete', 'id': item_id, 'values': {}}])
+    except BatchError as e:
+        return jsonify({'error': str(e)}), e.status
     return jsonify({'message': 'Assignment deleted successfully'})
 
 # ---------- Handwriting Assignment Generator ----------
-openai.api_key = os.environ.get('OPENAI_API_KEY')
 def allowed_handwriting_file(filename):
     return allowed(filename, ALLOWED_HANDWRITING_EXTS)
 
-def generate_assignment_text(topic):
-    prompt = f"Write a detailed assignment on the topic: {topic}."
-    try:
-        response = openai.Completion.create(
-            engine="text-davinci-003",
-            prompt=prompt,
-            max_tokens=500,
-            temperature=0.7,
+DOCX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+ASSIGNMENT_MODEL = 'gpt-3.5-turbo'
+ASSIGNMENT_SYSTEM_PROMPT = "You are a helpful assistant who writes detailed assignments."
+
+class OpenAIChatClient:
+    def complete(self, messages, max_tokens: int, temperature: float, timeout: float) -> str:
+        import openai
+        openai.api_key = os.environ.get('OPENAI_API_KEY')
+        response = openai.ChatCompletion.create(
+            model=ASSIGNMENT_MODEL,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            request_timeout=timeout,
         )
-        return response.choices[0].text.strip()
-    except Exception as e:
-        return f"Error generating assignment: {e}"
+        return response['choices'][0]['message']['content'].strip()
 
-@app.route('/upload-handwriting', methods=['POST'])
-def upload_handwriting():
+class StubChatClient:
+    """Offline stand-in for OpenAI (``STUDIST_LLM=stub``), for load tests and dev."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def complete(self, messages, max_tokens: int, temperature: float, timeout: float) -> str:
+        if self.latency:
+            time.sleep(min(self.latency, timeout))
+        prompt = messages[-1]['content']
+        return f"[stub assignment]\n\n{prompt}\n\n" + "Lorem ipsum dolor sit amet. " * (max_tokens // 10)
+
+def create_llm_client():
+    if app.config['LLM_CLIENT'] == 'stub':
+        return StubChatClient(latency=app.config['LLM_STUB_LATENCY'])
+    return OpenAIChatClient()
+
+LLM_CLIENT = create_llm_client()
+
+def assignment_prompt(topic: str) -> str:
+    return f"Write a detailed assignment on the topic: {topic}."
+
+@instrumented('generate_assignment_text')
+def complete_assignment_text(topic: str) -> str:
+    return LLM_CLIENT.complete(
+        [
+            {"role": "system", "content": ASSIGNMENT_SYSTEM_PROMPT},
+            {"role": "user", "content": assignment_prompt(topic)}
+        ],
+        max_tokens=500,
+        temperature=0.7,
+        timeout=app.config['ASSIGNMENT_JOB_TIMEOUT'],
+    )
+
+@instrumented('render_docx')
+def render_assignment_docx(topic: str, assignment_text: str) -> bytes:
+    from docx import Document
+    doc = Document()
+    doc.add_heading(topic, level=0)
+    doc.add_paragraph(assignment_text)
+    byte_io = BytesIO()
+    doc.save(byte_io)
+    return byte_io.getvalue()
+
+def cached_assignment_text(topic: str) -> str:
+    # Errors propagate (and are not cached) so the job is reported as failed.
+    return ASSIGNMENT_TEXT_CACHE.get_or_create(
+        assignment_cache_key(topic),
+        lambda: complete_assignment_text(topic).encode('utf-8'),
+    ).decode('utf-8')
+
+def build_assignment_docx(topic: str) -> bytes:
+    # Text is shared by every topic that normalizes alike; the rendered document
+    # is cached per exact topic, since its heading is the requester's own wording.
+    return ASSIGNMENT_DOCX_CACHE.get_or_create(
+        assignment_docx_key(topic),
+        lambda: render_assignment_docx(topic, cached_assignment_text(topic)),
+    )
+
+# ---------- Generated Assignment Cache ----------
+def normalize_topic(topic: str) -> str:
+    # Unlike preprocess(), keeps stop words and numerals: "World War One" and
+    # "World War Two", or "before 1900" and "after 1900", are different topics.
+    doc = get_nlp()(' '.join(topic.lower().split()))
+    lemmas = [token.lemma_ or token.lower_ for token in doc if not token.is_punct and not token.is_space]
+    return ' '.join(lemmas) if lemmas else ' '.join(topic.lower().split())
+
+def assignment_cache_key(topic: str) -> str:
+    """Content address of a generated document: normalized topic, model and prompt."""
+    material = json.dumps([
+        normalize_topic(topic),
+        app.config['LLM_CLIENT'],
+        ASSIGNMENT_MODEL,
+        ASSIGNMENT_SYSTEM_PROMPT,
+        assignment_prompt('{topic}'),
+    ])
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+def assignment_docx_key(topic: str) -> str:
+    return hashlib.sha256(json.dumps([assignment_cache_key(topic), topic]).encode('utf-8')).hexdigest()
+
+class AssignmentCache:
+    """Generated assignment bytes keyed by content address, in memory and on disk.
+
+    The disk layer is shared by all workers: files live in ``folder`` and their
+    size/created bookkeeping in STORE (``collection``), written only when an
+    entry is created, so hits cost no writes. It is evicted oldest first once
+    ``max_bytes`` is exceeded and entries expire after ``ttl`` seconds. A small
+    in-memory LRU sits in front. Concurrent misses for the same key in one
+    worker share a single build.
+    """
+
+    def __init__(self, folder: str, collection: str, suffix: str, max_bytes: int, ttl: float,
+                 memory_items: int = 32):
+        self.folder = folder
+        self.collection = collection
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.memory_items = memory_items
+        self._memory = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        os.makedirs(folder, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.folder, f"{key}{self.suffix}")
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                return entry[1]
+        meta = STORE.get(self.collection, key)
+        if meta is None or now - meta['created'] >= self.ttl:
+            return None
+        try:
+            with open(self._path(key), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        self._remember(key, meta['created'], data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        now = time.time()
+        fd, tmp = tempfile.mkstemp(dir=self.folder, prefix='.tmp-')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, self._path(key))
+        STORE.put(self.collection, key, {'size': len(data), 'created': now})
+        self._remember(key, now, data)
+        self.evict()
+
+    def _remember(self, key: str, created: float, data: bytes) -> None:
+        with self._lock:
+            self._memory[key] = (created, data)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def evict(self) -> None:
+        now = time.time()
+        entries = sorted(STORE.items(self.collection), key=lambda kv: kv[1]['created'])
+        total = sum(meta['size'] for _, meta in entries)
+        for key, meta in entries:
+            if total <= self.max_bytes and now - meta['created'] < self.ttl:
+                continue
+            total -= meta['size']
+            STORE.delete(self.collection, key)
+            with self._lock:
+                self._memory.pop(key, None)
+            if os.path.exists(self._path(key)):
+                os.remove(self._path(key))
+
+    def get_or_create(self, key: str, factory) -> bytes:
+        data = self.get(key)
+        if data is not None:
+            return data
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self._inflight[key] = Future()
+        if not owner:
+            return future.result()
+        try:
+            data = factory()
+            self.put(key, data)
+            future.set_result(data)
+            return data
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+# Model output per normalized topic, and the rendered .docx per exact topic.
+ASSIGNMENT_TEXT_CACHE = AssignmentCache(
+    os.path.join(GENERATED_FOLDER, 'text_cache'), 'assignment_text_cache', '.txt',
+    max_bytes=app.config['ASSIGNMENT_CACHE_MAX_BYTES'],
+    ttl=app.config['ASSIGNMENT_CACHE_TTL'],
+)
+ASSIGNMENT_DOCX_CACHE = AssignmentCache(
+    os.path.join(GENERATED_FOLDER, 'cache'), 'assignment_cache', '.docx',
+    max_bytes=app.config['ASSIGNMENT_CACHE_MAX_BYTES'],
+    ttl=app.config['ASSIGNMENT_CACHE_TTL'],
+)
+
+# ---------- Assignment Generation Jobs ----------
+class JobRejected(Exception):
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
+
+class AssignmentJobQueue:
+    """Bounded worker pool for assignment generation.
+
+    Job state lives in STORE (collection ``jobs``) and finished documents in
+    GENERATED_FOLDER, so any worker process can answer status and result
+    requests; only execution is local to the worker that accepted the job.
+    """
+
+    def __init__(self, max_workers: int, per_user_limit: int, max_pending: int, result_ttl: float):
+        self.max_workers = max_workers
+        self.per_user_limit = per_user_limit
+        self.max_pending = max_pending
+        self.result_ttl = result_ttl
+        self._executor = None
+        self._active = {}
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix='assignment-job')
+            return self._executor
+
+    def submit(self, username: str, topic: str) -> dict:
+        cached = ASSIGNMENT_DOCX_CACHE.get(assignment_docx_key(topic))
+        if cached is None and ASSIGNMENT_TEXT_CACHE.get(assignment_cache_key(topic)) is not None:
+            cached = build_assignment_docx(topic)  # Only rendering left, no model call.
+        if cached is not None:
+            # Already generated: finish the job inline without taking a pool slot.
+            job = self._new_job(username, topic)
+            self._finish(job, cached)
+            return dict(job, status='done')
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobRejected('Generator is busy, please try again shortly.', 503)
+            if self._active.get(username, 0) >= self.per_user_limit:
+                raise JobRejected('Too many assignments in progress; wait for one to finish.', 429)
+            self._pending += 1
+            self._active[username] = self._active.get(username, 0) + 1
+        job = self._new_job(username, topic)
+        STORE.put('jobs', job['id'], job)
+        self._pool().submit(self._run, job)
+        self.purge_expired()
+        return job
+
+    def _new_job(self, username: str, topic: str) -> dict:
+        return {
+            'id': uuid.uuid4().hex,
+            'user': username,
+            'topic': topic,
+            'status': 'queued',
+            'error': None,
+            'created': time.time(),
+            'finished': None,
+        }
+
+    def _finish(self, job: dict, data: bytes) -> None:
+        with open(job_result_path(job['id']), 'wb') as f:
+            f.write(data)
+        STORE.put('jobs', job['id'], dict(job, status='done', finished=time.time()))
+
+    def _run(self, job: dict) -> None:
+        try:
+            STORE.put('jobs', job['id'], dict(job, status='running'))
+            self._finish(job, build_assignment_docx(job['topic']))
+        except Exception as e:
+            STORE.put('jobs', job['id'], dict(job, status='failed', error=str(e), finished=time.time()))
+        finally:
+            with self._lock:
+                self._pending -= 1
+                self._active[job['user']] -= 1
+                if not self._active[job['user']]:
+                    del self._active[job['user']]
+
+    def get(self, job_id: str):
+        job = STORE.get('jobs', job_id)
+        if job and job['status'] in ('queued', 'running'):
+            # Threads cannot be cancelled; report jobs stuck past the timeout.
+            if time.time() - job['created'] > app.config['ASSIGNMENT_JOB_TIMEOUT'] * 2 + 60:
+                job = dict(job, status='failed', error='Timed out')
+        return job
+
+    def wait(self, job_id: str, timeout: float):
+        deadline = time.time() + timeout
+        job = self.get(job_id)
+        while job and job['status'] in ('queued', 'running') and time.time() < deadline:
+            time.sleep(0.1)
+            job = self.get(job_id)
+        return job
+
+    def purge_expired(self) -> None:
+        cutoff = time.time() - self.result_ttl
+        for job_id, job in STORE.items('jobs'):
+            if job.get('finished') and job['finished'] < cutoff:
+                STORE.delete('jobs', job_id)
+                if os.path.exists(job_result_path(job_id)):
+                    os.remove(job_result_path(job_id))
+
+def job_result_path(job_id: str) -> str:
+    return os.path.join(GENERATED_FOLDER, f"{job_id}.docx")
+
+ASSIGNMENT_JOBS = AssignmentJobQueue(
+    max_workers=app.config['ASSIGNMENT_WORKERS'],
+    per_user_limit=app.config['ASSIGNMENT_JOBS_PER_USER'],
+    max_pending=app.config['ASSIGNMENT_MAX_PENDING'],
+    result_ttl=app.config['ASSIGNMENT_RESULT_TTL'],
+)
+
+def submit_assignment_job():
+    """Validate an upload-handwriting form and queue its job; returns (job, error_response)."""
+    username = current_username(request.form.get('username')) or request.remote_addr
     topic = request.form.get('topic')
     file = request.files.get('file')
     if not topic or not file:
-        return jsonify({'error': 'Missing topic or file'}), 400
+        return None, (jsonify({'error': 'Missing topic or file'}), 400)
     if not allowed(file.filename, ALLOWED_DOC_EXTS):
-        return jsonify({'error': 'File type not allowed'}), 400
+        return None, (jsonify({'error': 'File type not allowed'}), 400)
     filename = secure_filename(file.filename)
     path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
     file.save(path)
     # Optional: process file for handwriting/extract first page
-    assignment_text = generate_assignment_text(topic)
-    doc = Document()
-    doc.add_heading(topic, level=0)
-    doc.add_paragraph(assignment_text)
-    byte_io = BytesIO()
-    doc.save(byte_io)
-    byte_io.seek(0)
+    try:
+        return ASSIGNMENT_JOBS.submit(username, topic), None
+    except JobRejected as e:
+        return None, (jsonify({'error': str(e)}), e.status)
+
+def requested_job(job_id: str):
+    """The job, if it belongs to whoever is asking (the user, or the address of anonymous clients)."""
+    job = ASSIGNMENT_JOBS.get(job_id)
+    if job and job['user'] == (current_username() or request.remote_addr):
+        return job
+    return None
+
+def job_status_json(job: dict) -> dict:
+    return {
+        'job_id': job['id'],
+        'status': job['status'],
+        'error': job['error'],
+        'status_url': url_for('assignment_job_status', job_id=job['id']),
+        'result_url': url_for('assignment_job_result', job_id=job['id']),
+    }
+
+@app.route('/assignment-jobs', methods=['POST'])
+def create_assignment_job():
+    job, error = submit_assignment_job()
+    if error:
+        return error
+    return jsonify(job_status_json(job)), 202
+
+@app.route('/assignment-jobs/<job_id>')
+def assignment_job_status(job_id):
+    job = requested_job(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown job'}), 404
+    return jsonify(job_status_json(job))
+
+@app.route('/assignment-jobs/<job_id>/result')
+def assignment_job_result(job_id):
+    job = requested_job(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown job'}), 404
+    if job['status'] != 'done':
+        return jsonify(job_status_json(job)), 409
     return send_file(
-        byte_io,
+        os.path.abspath(job_result_path(job_id)),
         as_attachment=True,
-        download_name=f"{topic}_assignment.docx",
-        mimetype='application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+        download_name=f"{job['topic']}_assignment.docx",
+        mimetype=DOCX_MIMETYPE
     )
 
-
-# ---------- Generate Assignment Form ----------
-def generate_assignment_text(topic):
-    try:
-        response = openai.ChatCompletion.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant who writes detailed assignments."},
-                {"role": "user", "content": f"Write a detailed assignment on the topic: {topic}."}
-            ],
-            max_tokens=500,
-            temperature=0.7,
-        )
-        return response['choices'][0]['message']['content'].strip()
-    except Exception as e:
-        return f"Error generating assignment: {e}"
+@app.route('/upload-handwriting', methods=['POST'])
+def upload_handwriting():
+    # Synchronous variant kept for existing clients; the work still runs in the
+    # bounded job pool. New clients should use /assignment-jobs.
+    job, error = submit_assignment_job()
+    if error:
+        return error
+    job = ASSIGNMENT_JOBS.wait(job['id'], app.config['ASSIGNMENT_JOB_TIMEOUT'])
+    if job['status'] != 'done':
+        return jsonify({'error': job['error'] or 'Assignment generation timed out', 'job_id': job['id']}), 504
+    return assignment_job_result(job['id'])
 
 
 # ---------- Timetable ----------
@@ -401,6 +2620,138 @@ def timetable():
         return redirect(url_for('login'))
     return render_template('timetable.html', username=session['username'])
 
+TIMETABLE_DAYS = ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday')
+TIMETABLE_SLOTS = 24
+TIMETABLE_FORMAT = 2
+
+# Timetables are stored compactly: subject names are interned into a per-timetable
+# table and each cell is null (free), a table index, or [index-or-null, note].
+# Trailing free cells are dropped, so a mostly-empty week is a few dozen bytes:
+#   {"v": 2, "subjects": ["Math", "Physics"], "days": {"Monday": [1, 0, [0, "lab"]]}}
+# Older documents hold {day: [{"value": ..., "note": ...} or "Subject", ...]}.
+
+def decode_timetable(stored) -> dict:
+    """The client-facing grid, {day: [{"value": ..., "note": ...}, ...]}."""
+    if not isinstance(stored, dict):
+        return {}
+    if stored.get('v') == TIMETABLE_FORMAT:
+        subjects = stored.get('subjects', [])
+        grid = {}
+        for day, cells in stored.get('days', {}).items():
+            row = []
+            for cell in cells:
+                index, note = cell if isinstance(cell, list) else (cell, '')
+                row.append({'value': subjects[index] if index is not None else '', 'note': note})
+            grid[day] = row
+        return grid
+    grid = {}
+    for day, cells in stored.items():
+        if not isinstance(cells, list):
+            continue
+        grid[day] = [
+            {'value': str(cell.get('value') or ''), 'note': str(cell.get('note') or '')}
+            if isinstance(cell, dict) else {'value': str(cell or ''), 'note': ''}
+            for cell in cells
+        ]
+    return grid
+
+def encode_timetable(grid: dict) -> dict:
+    subjects = []
+    positions = {}
+    days = {}
+    for day, cells in grid.items():
+        row = []
+        for cell in cells:
+            value = cell.get('value') or ''
+            note = cell.get('note') or ''
+            index = None
+            if value:
+                index = positions.get(value)
+                if index is None:
+                    index = positions[value] = len(subjects)
+                    subjects.append(value)
+            row.append([index, note] if note else index)
+        while row and row[-1] is None:
+            row.pop()
+        if row:
+            days[day] = row
+    return {'v': TIMETABLE_FORMAT, 'subjects': subjects, 'days': days}
+
+def parse_timetable_grid(data) -> dict:
+    """Validate a full grid posted by the client; ValueError if malformed."""
+    if not isinstance(data, dict):
+        raise ValueError('timetable must be an object')
+    grid = {}
+    for day, cells in data.items():
+        if day not in TIMETABLE_DAYS or not isinstance(cells, list) or len(cells) > TIMETABLE_SLOTS:
+            raise ValueError(f"invalid day {day!r}")
+        grid[day] = [parse_timetable_cell(cell) for cell in cells]
+    return grid
+
+def parse_timetable_cell(cell) -> dict:
+    if isinstance(cell, str):
+        return {'value': cell.strip(), 'note': ''}
+    if not isinstance(cell, dict):
+        raise ValueError('invalid cell')
+    value, note = cell.get('value') or '', cell.get('note') or ''
+    if not isinstance(value, str) or not isinstance(note, str):
+        raise ValueError('invalid cell')
+    return {'value': value.strip(), 'note': note.strip()}
+
+def apply_timetable_changes(grid: dict, changes) -> dict:
+    for change in changes:
+        day, slot = change['day'], change['slot']
+        row = grid.setdefault(day, [])
+        while len(row) <= slot:
+            row.append({'value': '', 'note': ''})
+        row[slot] = change['cell']
+    return grid
+
+def parse_timetable_changes(changes) -> list:
+    """Validate a PATCH body's cell deltas; ValueError if malformed."""
+    if not isinstance(changes, list):
+        raise ValueError('changes must be a list')
+    parsed = []
+    for change in changes:
+        if not isinstance(change, dict) or change.get('day') not in TIMETABLE_DAYS:
+            raise ValueError('each change needs a valid day')
+        slot = change.get('slot')
+        if not isinstance(slot, int) or isinstance(slot, bool) or not 0 <= slot < TIMETABLE_SLOTS:
+            raise ValueError('each change needs a slot between 0 and %d' % (TIMETABLE_SLOTS - 1))
+        parsed.append({'day': change['day'], 'slot': slot, 'cell': parse_timetable_cell(change)})
+    return parsed
+
+class TimetableResponses:
+    """Pre-serialized /load-timetable bodies, keyed by the store's document version.
+
+    A hit costs one version probe; the grid is decoded and serialized only after
+    the timetable changes.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._bodies = OrderedDict()  # username -> (version, etag, body)
+        self._lock = threading.Lock()
+
+    def get(self, username: str):
+        version = STORE.version('timetable', username)
+        with self._lock:
+            entry = self._bodies.get(username)
+            if entry is not None and entry[0] == version:
+                self._bodies.move_to_end(username)
+                return entry[1], entry[2]
+        body = json.dumps(decode_timetable(STORE.get('timetable', username, {})),
+                          ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+        etag = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            self._bodies[username] = (version, etag, body)
+            self._bodies.move_to_end(username)
+            while len(self._bodies) > self.maxsize:
+                self._bodies.popitem(last=False)
+        return etag, body
+
+TIMETABLE_RESPONSES = TimetableResponses(app.config['DOC_CACHE_SIZE'])
+
 @app.route('/save-timetable', methods=['POST'])
 def save_timetable():
     if 'username' not in session:
@@ -408,17 +2759,41 @@ def save_timetable():
     data = request.json
     if not data or 'timetable' not in data:
         return jsonify({'error': 'Invalid data'}), 400
-    db = load_json('timetable.json', {})
-    db[session['username']] = data['timetable']
-    save_json('timetable.json', db)
+    try:
+        grid = parse_timetable_grid(data['timetable'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    STORE.put('timetable', session['username'], encode_timetable(grid))
     return jsonify({'message': 'Timetable saved successfully'})
 
+@app.route('/timetable', methods=['PATCH'])
+def patch_timetable():
+    """Apply cell deltas: {"changes": [{"day": "Monday", "slot": 0, "value": "Math", "note": ""}]}."""
+    if 'username' not in session:
+        return jsonify({'error': 'Not logged in'}), 401
+    try:
+        changes = parse_timetable_changes((request.get_json(silent=True) or {}).get('changes'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    STORE.update('timetable', session['username'],
+                 lambda stored: encode_timetable(apply_timetable_changes(decode_timetable(stored), changes)), {})
+    etag, _ = TIMETABLE_RESPONSES.get(session['username'])
+    response = jsonify({'message': 'Timetable updated', 'changed': len(changes)})
+    response.set_etag(etag)
+    return response
+
 @app.route('/load-timetable')
 def load_timetable():
     if 'username' not in session:
         return jsonify({'error': 'Not logged in'}), 401
-    db = load_json('timetable.json', {})
-    return jsonify(db.get(session['username'], {}))
+    etag, body = TIMETABLE_RESPONSES.get(session['username'])
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
 
 @app.route('/get-timetable')
 def get_timetable():
@@ -431,23 +2806,82 @@ def update_subjects():
         return jsonify({'error': 'Not logged in'}), 401
     data = request.json or {}
     subjects = data.get('subjects', [])
-    db = load_json('subjects.json', {})
-    db[session['username']] = subjects
-    save_json('subjects.json', db)
+    STORE.put('subjects', session['username'], subjects)
     return jsonify({'message': 'Subjects updated', 'subjects': subjects})
 
 @app.route('/get-subjects')
 def get_subjects():
     if 'username' not in session:
         return jsonify([])
-    db = load_json('subjects.json', {})
-    return jsonify(db.get(session['username'], []))
+    return jsonify(STORE.get('subjects', session['username'], []))
 
 # ---------- Chatbot ----------
-def preprocess(text):
-    doc = nlp(text.lower())
+def doc_lemmas(doc):
     return [token.lemma_ for token in doc if not token.is_stop and not token.is_punct]
 
+class NlpBatcher:
+    """Gathers texts arriving within ``window`` seconds and parses them with one
+    ``nlp.pipe`` call, so concurrent chat messages share the per-call overhead.
+    A window of 0 parses each text inline.
+    """
+
+    def __init__(self, window: float, batch_size: int):
+        self.window = window
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    def lemmas(self, text: str) -> list:
+        if self.window <= 0:
+            return doc_lemmas(get_nlp()(text))
+        self._ensure_thread()
+        future = Future()
+        self._queue.put((text, future))
+        return future.result()
+
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._thread_pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name='nlp-batcher', daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                with span('nlp_batch'):
+                    docs = get_nlp().pipe([text for text, _ in batch], batch_size=self.batch_size)
+                    lemmas = [doc_lemmas(doc) for doc in docs]
+                for (_, future), result in zip(batch, lemmas):
+                    future.set_result(result)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+NLP_BATCHER = NlpBatcher(app.config['NLP_BATCH_WINDOW_MS'] / 1000, app.config['NLP_BATCH_SIZE'])
+
+@functools.lru_cache(maxsize=app.config['LEMMA_CACHE_SIZE'])
+def cached_lemmas(normalized: str) -> tuple:
+    return tuple(NLP_BATCHER.lemmas(normalized))
+
+@instrumented('preprocess')
+def preprocess(text):
+    # Normalize before the memo lookup so "Hi", "hi " and "HI" share one entry.
+    return list(cached_lemmas(' '.join(text.lower().split())))
+
 INTENTS = {
     "greeting": ["hi", "hello", "hey", "greetings"],
     "goodbye": ["bye", "goodbye", "see you", "farewell"],
@@ -469,83 +2903,521 @@ RESPONSES = {
     "default": ["I'm not sure I understand. Could you rephrase?", "Sorry, I didn't get that. Please ask differently."]
 }
 
+WORD_RE = re.compile(r"[a-z0-9']+")
+# Messages this short are classified from their raw words alone when that finds
+# an intent; spaCy only runs for longer messages or when nothing matched.
+FAST_PATH_MAX_WORDS = 6
+
+class IntentIndex:
+    """INTENTS compiled once into lookup tables.
+
+    Every keyword gets an id. Single-word keywords are indexed under both their
+    raw and lemmatized forms, multi-word keywords ("see you", "class time") as
+    word tuples. Scoring is then one pass over the message: the score of an
+    intent is the number of its distinct keywords found, as before.
+    """
+
+    def __init__(self, intents: dict, lemmatize):
+        self.names = list(intents)
+        self.keyword_intent = []
+        self.terms = {}
+        self.phrases = {}
+        for intent_id, name in enumerate(self.names):
+            for keyword in intents[name]:
+                keyword_id = len(self.keyword_intent)
+                self.keyword_intent.append(intent_id)
+                words = tuple(WORD_RE.findall(keyword.lower()))
+                if len(words) > 1:
+                    self.phrases.setdefault(words, []).append(keyword_id)
+                    continue
+                for term in {words[0], *lemmatize(keyword)} - {''}:
+                    self.terms.setdefault(term, []).append(keyword_id)
+        self.phrase_lengths = sorted({len(p) for p in self.phrases})
+
+    def match(self, words, lemmas=()) -> set:
+        matched = set()
+        for term in (*words, *lemmas):
+            matched.update(self.terms.get(term, ()))
+        for n in self.phrase_lengths:
+            for i in range(len(words) - n + 1):
+                matched.update(self.phrases.get(tuple(words[i:i + n]), ()))
+        return matched
+
+    def best(self, matched: set) -> str:
+        if not matched:
+            return "default"
+        scores = [0] * len(self.names)
+        for keyword_id in matched:
+            scores[self.keyword_intent[keyword_id]] += 1
+        # First intent wins ties, like max() over the INTENTS dict did.
+        return self.names[scores.index(max(scores))]
+
+_intent_index = None
+_intent_index_lock = threading.Lock()
+
+def get_intent_index() -> IntentIndex:
+    # Built on the first chatbot message: lemmatizing the keywords needs spaCy.
+    global _intent_index
+    if _intent_index is None:
+        with _intent_index_lock:
+            if _intent_index is None:
+                _intent_index = IntentIndex(INTENTS, preprocess)
+    return _intent_index
+
+def classify_intent(message: str) -> str:
+    words = WORD_RE.findall(message.lower())
+    index = get_intent_index()
+    matched = index.match(words)
+    if not matched or len(words) > FAST_PATH_MAX_WORDS:
+        matched |= index.match((), preprocess(message))
+    return index.best(matched)
+
 @app.route('/chatbot', methods=['POST'])
 def chatbot():
     user_msg = request.json.get('message', '').strip()
     if not user_msg:
         return jsonify({"response": "Please enter a message."})
-    tokens = preprocess(user_msg)
-    intent_scores = {}
-    for intent, keywords in INTENTS.items():
-        intent_tokens = [kw.lower() for kw in keywords]
-        score = len(set(tokens) & set(intent_tokens))
-        intent_scores[intent] = score
-    best_intent = max(intent_scores, key=intent_scores.get)
-    if intent_scores[best_intent] == 0:
-        best_intent = "default"
+    best_intent = classify_intent(user_msg)
     reply = random.choice(RESPONSES.get(best_intent, RESPONSES["default"]))
     return jsonify({"response": reply})
 
 # ---------- Spotify ----------
 @app.route('/save-spotify', methods=['POST'])
 def save_spotify():
-    username = request.form.get('username') or session.get('username')
+    username = current_username(request.form.get('username'))
     if not username:
         return redirect('/')
     raw = request.form.get('spotify_url', '').strip()
     embed = to_spotify_embed(raw) if raw else "https://open.spotify.com/embed/playlist/37i9dQZF1DXcBWIGoYBM5M"
-    db = load_json('spotify.json', {})
-    db[username] = embed
-    save_json('spotify.json', db)
+    STORE.put('spotify', username, embed)
     return redirect(f"/dashboard?user={username}")
 
 # ------------------------
 # Notes with JSON persistence
 # ------------------------
+# Each note is its own STORE document (collection 'note_items', key
+# '<username>/<note id>'), so an edit writes one note instead of rewriting the
+# whole notebook. Notes carry a version; a writer that sends the version it last
+# saw (If-Match, or a 'version' field) is refused if someone else saved since.
+class NoteConflict(Exception):
+    def __init__(self, current: dict):
+        super().__init__('Note was changed by someone else')
+        self.current = current
+
+def note_key(username: str, note_id: str) -> str:
+    return f"{username}/{note_id}"
+
+def migrate_legacy_notes(username: str) -> None:
+    """Split a pre-ID notes list into per-note documents (idempotent)."""
+    legacy = STORE.get('notes', username)
+    if legacy is None:
+        return
+    for i, note in enumerate(legacy):
+        note_id = f"legacy{i:05d}"
+        STORE.insert('note_items', note_key(username, note_id), {
+            'id': note_id,
+            'title': note.get('title', ''),
+            'content': note.get('content', ''),
+            'date': note.get('date', ''),
+            'created': i,  # Keeps the old order, ahead of notes created later.
+            'version': 1,
+        })
+    STORE.delete('notes', username)
+
+def create_note(username: str, title: str, content: str, date_str: str) -> dict:
+    note = {
+        'id': uuid.uuid4().hex[:12],
+        'title': title,
+        'content': content,
+        'date': date_str or datetime.today().strftime('%Y-%m-%d'),
+        'created': time.time(),
+        'version': 1,
+    }
+    STORE.put('note_items', note_key(username, note['id']), note)
+    reindex_async(username, [f"note:{note['id']}"])
+    return note
+
+def update_note(username: str, note_id: str, changes: dict, expected_version=None) -> dict:
+    """Apply ``changes`` (title/content/date) to one note; KeyError if it does not exist."""
+    def apply(note):
+        if note is None:
+            raise KeyError(note_id)
+        if expected_version is not None and note['version'] != expected_version:
+            raise NoteConflict(note)
+        note.update({k: v for k, v in changes.items() if k in NOTE_FIELDS})
+        note['version'] += 1
+        return note
+    note = STORE.update('note_items', note_key(username, note_id), apply)
+    reindex_async(username, [f"note:{note_id}"])
+    return note
+
+def delete_note(username: str, note_id: str, expected_version=None) -> bool:
+    def check(note):
+        if expected_version is not None and note['version'] != expected_version:
+            raise NoteConflict(note)
+        return True
+    deleted = STORE.delete_if('note_items', note_key(username, note_id), check)
+    if deleted:
+        reindex_async(username, [f"note:{note_id}"])
+    return deleted
+
+def expected_note_version(data: dict):
+    header = request.headers.get('If-Match')
+    value = header.strip().removeprefix('W/').strip('"') if header and header.strip() != '*' else data.get('version')
+    if value in (None, ''):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        abort(400)
+
+NOTE_FIELDS = ('title', 'content', 'date')
+
+def note_field_error(data: dict):
+    """A 400 response if a JSON note body has a non-string field, else None."""
+    for field in NOTE_FIELDS:
+        if field in data and data[field] is not None and not isinstance(data[field], str):
+            return jsonify({'error': f'{field} must be a string'}), 400
+    return None
+
+def note_response(note: dict, status: int = 200):
+    response = jsonify(note)
+    response.status_code = status
+    response.set_etag(str(note['version']))
+    return response
+
 @app.route('/notes', methods=['GET', 'POST'])
 def notes_page():
-    user = request.args.get('user')
+    user = current_username()
     if not user:
-        return "User not specified", 400
-    notes = load_notes(user)
+        return redirect('/')
     if request.method == 'POST':
         action = request.form.get('action')
-        if action == 'save':
-            title = request.form.get('title', '').strip()
-            content = request.form.get('content', '').strip()
-            date_str = request.form.get('date', '').strip()
-            index = request.form.get('index')
-            if not title:
-                return "Title is required", 400
-            if not date_str:
-                date_str = datetime.today().strftime('%Y-%m-%d')
-            note = {
-                'title': title,
-                'content': content,
-                'date': date_str
-            }
-            if index and index.isdigit():
-                idx = int(index)
-                if 0 <= idx < len(notes):
-                    notes[idx] = note
+        note_id = request.form.get('id')
+        try:
+            if action == 'save':
+                title = request.form.get('title', '').strip()
+                content = request.form.get('content', '').strip()
+                date_str = request.form.get('date', '').strip()
+                if not title:
+                    return "Title is required", 400
+                if note_id:
+                    update_note(user, note_id, {'title': title, 'content': content,
+                                                'date': date_str or datetime.today().strftime('%Y-%m-%d')},
+                                expected_note_version(request.form))
                 else:
-                    return "Invalid note index", 400
-            else:
-                notes.append(note)
-            save_notes(user, notes)
-            return redirect(url_for('notes_page', user=user))
-        elif action == 'delete':
-            index = request.form.get('index')
-            if index and index.isdigit():
-                idx = int(index)
-                if 0 <= idx < len(notes):
-                    notes.pop(idx)
-                    save_notes(user, notes)
+                    create_note(user, title, content, date_str)
+                return redirect(url_for('notes_page', user=user))
+            elif action == 'delete':
+                if note_id and delete_note(user, note_id, expected_note_version(request.form)):
                     return redirect(url_for('notes_page', user=user))
-                else:
-                    return "Invalid note index", 400
-    return render_template('notes.html', user=user, notes=notes)
+                return "Invalid note", 400
+        except KeyError:
+            return "Invalid note", 400
+        except NoteConflict:
+            return "This note was changed in another tab. Reload the page and try again.", 409
+    return render_template('notes.html', user=user, notes=load_notes(user))
+
+@app.route('/api/notes', methods=['GET', 'POST'])
+def notes_api():
+    username = current_username()
+    if not username:
+        return jsonify({'error': 'Not logged in'}), 401
+    if request.method == 'GET':
+        return jsonify(load_notes(username))
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    error = note_field_error(data)
+    if error:
+        return error
+    title = (data.get('title') or '').strip()
+    if not title:
+        return jsonify({'error': 'Title is required'}), 400
+    migrate_legacy_notes(username)
+    note = create_note(username, title, (data.get('content') or '').strip(), (data.get('date') or '').strip())
+    return note_response(note, 201)
+
+@app.route('/api/notes/<note_id>', methods=['GET', 'PATCH', 'DELETE'])
+def note_api(note_id):
+    username = current_username()
+    if not username:
+        return jsonify({'error': 'Not logged in'}), 401
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    migrate_legacy_notes(username)
+    try:
+        if request.method == 'GET':
+            note = STORE.get('note_items', note_key(username, note_id))
+            if note is None:
+                raise KeyError(note_id)
+            return note_response(note)
+        if request.method == 'PATCH':
+            error = note_field_error(data)
+            if error:
+                return error
+            if 'title' in data and not (data['title'] or '').strip():
+                return jsonify({'error': 'Title is required'}), 400
+            changes = {k: data[k] or '' for k in NOTE_FIELDS if k in data}
+            return note_response(update_note(username, note_id, changes, expected_note_version(data)))
+        if not delete_note(username, note_id, expected_note_version(data)):
+            raise KeyError(note_id)
+        return '', 204
+    except KeyError:
+        return jsonify({'error': 'Note not found'}), 404
+    except NoteConflict as e:
+        response = jsonify({'error': 'Version mismatch', 'current': e.current})
+        response.status_code = 412
+        response.set_etag(str(e.current['version']))
+        return response
+
+# ---------- Search ----------
+# A per-user inverted index in collection 'search', one row per document
+# and one per term, so updating a document only touches the rows of its terms:
+#   <user>/stats       {'docs': int, 'total_len': int}
+#   <user>/doc/<id>    {'title', 'kind', 'link', 'preview', 'sig', 'len', 'terms': {term: tf}}
+#   <user>/term/<term> {doc_id: [tf, doc_len]}
+# Documents are notes ('note:<id>'), assignments ('assignment:<id>') and
+# uploaded files ('file:<name>'). Routes update single documents as they write;
+# text extraction for uploads runs in the background. Index rows are read and
+# written through SEARCH_STORE, whose own LRU keeps them from evicting user
+# documents out of STORE's.
+SEARCH_STORE = CachedStore(STORE.store, maxsize=app.config['SEARCH_CACHE_SIZE'])
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+SEARCH_PREVIEW_CHARS = 160
+
+SEARCH_EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix='search-index')
+
+_terms_memo = OrderedDict()
+_terms_memo_lock = threading.Lock()
+
+def text_terms(text: str):
+    """Lemma term frequencies and document length, memoized by content hash."""
+    sig = hashlib.sha1(text.encode('utf-8')).hexdigest()
+    with _terms_memo_lock:
+        if sig in _terms_memo:
+            _terms_memo.move_to_end(sig)
+            return _terms_memo[sig]
+    counts = Counter()
+    paragraphs = [p for p in re.split(r'\n\s*\n', text) if p.strip()]
+    for doc in get_nlp().pipe((p.lower() for p in paragraphs), batch_size=64):
+        for token in doc:
+            if (token.is_alpha or token.is_digit) and not token.is_stop:
+                counts[(token.lemma_ or token.lower_).lower()] += 1
+    result = (dict(counts), sum(counts.values()))
+    with _terms_memo_lock:
+        _terms_memo[sig] = result
+        while len(_terms_memo) > 2048:
+            _terms_memo.popitem(last=False)
+    return result
+
+def search_key(username: str, *parts: str) -> str:
+    return '/'.join((username,) + parts)
+
+def search_stats(username: str):
+    return SEARCH_STORE.get('search', search_key(username, 'stats'))
+
+def index_documents(username: str, docs: dict, remove=()) -> None:
+    """Upsert ``docs`` ({doc_id: {'title', 'kind', 'link', 'text'}}) and drop ``remove``."""
+    if search_stats(username) is None:
+        # No index yet: build it from the user's current data (which already
+        # includes this change) instead of starting from a partial one.
+        build_search_index(username)
+        return
+    prepared = {}
+    for doc_id, doc in docs.items():
+        text = doc['text']
+        terms, length = text_terms(text)
+        prepared[doc_id] = {
+            'title': doc['title'], 'kind': doc['kind'], 'link': doc['link'],
+            'preview': ' '.join(text.split())[:SEARCH_PREVIEW_CHARS],
+            'sig': hashlib.sha1(text.encode('utf-8')).hexdigest(),
+            'len': length, 'terms': terms,
+        }
+
+    def apply(get):
+        stats = get(search_key(username, 'stats'), {'docs': 0, 'total_len': 0})
+        changes = {}
+
+        def postings(term):
+            key = search_key(username, 'term', term)
+            if key not in changes:
+                changes[key] = get(key, {})
+            return changes[key]
+
+        for doc_id in [*remove, *prepared]:
+            key = search_key(username, 'doc', doc_id)
+            old = changes[key] if key in changes else get(key)
+            if old is not None:
+                stats['docs'] -= 1
+                stats['total_len'] -= old['len']
+                for term in old['terms']:
+                    postings(term).pop(doc_id, None)
+            changes[key] = None
+        for doc_id, doc in prepared.items():
+            changes[search_key(username, 'doc', doc_id)] = doc
+            stats['docs'] += 1
+            stats['total_len'] += doc['len']
+            for term, tf in doc['terms'].items():
+                postings(term)[doc_id] = [tf, doc['len']]
+        # Terms left without documents are deleted (a document row is never empty).
+        changes = {key: value or None for key, value in changes.items()}
+        changes[search_key(username, 'stats')] = stats
+        return changes
+    SEARCH_STORE.update_many('search', apply)
+
+def note_search_doc(username: str, note: dict) -> dict:
+    return {'title': note.get('title') or 'Note', 'kind': 'note',
+            'link': f"/notes?user={username}",
+            'text': f"{note.get('title', '')}\n\n{note.get('content', '')}"}
+
+def assignment_search_doc(username: str, assignment: dict) -> dict:
+    return {'title': assignment.get('subject') or 'Assignment', 'kind': 'assignment',
+            'link': f"/assignments?user={username}",
+            'text': f"{assignment.get('subject', '')}\n\n{assignment.get('description', '')}"}
+
+def index_notes(username: str, notes: list) -> None:
+    """Re-sync all note documents; notes whose text is unchanged are skipped."""
+    prefix = search_key(username, 'doc', '')
+    existing = {key[len(prefix):]: doc for key, doc in SEARCH_STORE.scan('search', prefix + 'note:')}
+    docs = {}
+    for note in notes:
+        doc = note_search_doc(username, note)
+        sig = hashlib.sha1(doc['text'].encode('utf-8')).hexdigest()
+        current = existing.get(f"note:{note['id']}")
+        if current is None or current['sig'] != sig or current['title'] != doc['title']:
+            docs[f"note:{note['id']}"] = doc
+    ids = {f"note:{note['id']}" for note in notes}
+    stale = [d for d in existing if d.startswith('note:') and d not in ids]
+    if docs or stale:
+        index_documents(username, docs, remove=stale)
+
+@instrumented('extract_text')
+def extract_text(path: str) -> str:
+    ext = path.rsplit('.', 1)[-1].lower()
+    if ext == 'pdf':
+        # pdftotext ships with poppler, which pdf2image already requires.
+        out = subprocess.run(['pdftotext', '-q', path, '-'], capture_output=True, timeout=120)
+        return out.stdout.decode('utf-8', errors='replace')
+    if ext == 'docx':
+        from docx import Document
+        return '\n\n'.join(p.text for p in Document(path).paragraphs)
+    return ''
+
+def load_search_doc(username: str, doc_id: str):
+    """The search document for ``doc_id`` as currently stored, or None if it is gone."""
+    kind, _, key = doc_id.partition(':')
+    if kind == 'note':
+        note = STORE.get('note_items', note_key(username, key))
+        return note_search_doc(username, note) if note else None
+    if kind == 'assignment':
+        for assignment in STORE.get('assignments', username, []):
+            if isinstance(assignment, dict) and assignment.get('id') == key:
+                return assignment_search_doc(username, assignment)
+        return None
+    if kind == 'file' and key in get_manifest(username):
+        try:
+            text = extract_text(os.path.join(app.config['UPLOAD_FOLDER'], username, key))
+        except Exception:
+            text = ''
+        return {'title': key, 'kind': 'file', 'link': f"/uploads/{username}/{key}",
+                'text': f"{key.rsplit('.', 1)[0].replace('_', ' ')}\n\n{text}"}
+    return None
+
+_index_locks = [threading.Lock() for _ in range(64)]
+
+def reindex_async(username: str, doc_ids) -> None:
+    """Bring ``doc_ids`` in line with the stored data on SEARCH_EXECUTOR.
+
+    Writes never wait for spaCy or the index, and never fail because of them.
+    Each job re-reads the documents under a per-user lock, so jobs that run out
+    of order still leave the latest version indexed.
+    """
+    doc_ids = list(doc_ids)
+    def run():
+        with _index_locks[hash(username) % len(_index_locks)]:
+            try:
+                docs = {doc_id: load_search_doc(username, doc_id) for doc_id in doc_ids}
+                index_documents(username, {d: doc for d, doc in docs.items() if doc is not None},
+                                remove=[d for d, doc in docs.items() if doc is None])
+            except Exception:
+                app.logger.exception("Search indexing failed for %s: %s", username, doc_ids)
+    SEARCH_EXECUTOR.submit(run)
+
+def index_file_async(username: str, filename: str) -> None:
+    reindex_async(username, [f"file:{filename}"])
+
+def build_search_index(username: str) -> None:
+    """First-time index for data written before search existed."""
+    SEARCH_STORE.insert('search', search_key(username, 'stats'), {'docs': 0, 'total_len': 0})
+    index_notes(username, load_notes(username))
+    index_documents(username, {
+        f"assignment:{a['id']}": assignment_search_doc(username, a)
+        for a in load_items('assignments', username)
+    })
+    for filename in get_manifest(username):
+        index_file_async(username, filename)
+
+def search_documents(username: str, query: str, limit: int = 20) -> list:
+    stats = search_stats(username)
+    if stats is None:
+        build_search_index(username)
+        stats = search_stats(username)
+    terms = set(text_terms(query)[0])
+    n_docs = stats['docs']
+    if not terms or not n_docs:
+        return []
+    avg_len = stats['total_len'] / n_docs or 1
+    scores = Counter()
+    for term in terms:
+        postings = SEARCH_STORE.get('search', search_key(username, 'term', term))
+        if not postings:
+            continue
+        idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+        for doc_id, (tf, doc_len) in postings.items():
+            scores[doc_id] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * doc_len / avg_len))
+    results = []
+    for doc_id, score in scores.most_common(limit):
+        doc = SEARCH_STORE.get('search', search_key(username, 'doc', doc_id))
+        if doc is None:
+            continue
+        results.append({'id': doc_id, 'title': doc['title'], 'kind': doc['kind'], 'link': doc['link'],
+                        'preview': doc['preview'], 'score': round(score, 4)})
+    return results
+
+@app.route('/search')
+def search():
+    username = current_username()
+    if not username:
+        return jsonify({'error': 'Not logged in'}), 401
+    query = request.args.get('q', '').strip()
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    return jsonify({'query': query, 'results': search_documents(username, query, limit) if query else []})
+
+# ---------- Preload ----------
+def preload_models() -> None:
+    """Import the heavy dependencies now instead of on first request.
+
+    Enabled with STUDIST_PRELOAD=1. Under ``gunicorn --preload`` this runs once
+    in the master, so the spaCy model is shared copy-on-write by every worker;
+    gc.freeze() keeps the collector from touching (and so copying) those pages.
+    """
+    get_intent_index()
+    import docx  # noqa: F401
+    import openai  # noqa: F401
+    gc.freeze()
+
+if app.config['PRELOAD_MODELS']:
+    preload_models()
 
 # ---------- Main ----------
 if __name__ == "__main__":
+    # Spawned render workers would re-import this script as __mp_main__ and rerun
+    # all of the startup above. A spec named "__main__" tells multiprocessing
+    # there is nothing to import; the pool only runs functions from pdf_render.
+    import importlib.machinery
+    __spec__ = importlib.machinery.ModuleSpec('__main__', None)
     app.run(debug=True, host='0.0.0.0', port=5000)
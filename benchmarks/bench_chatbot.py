@@ -0,0 +1,75 @@
+"""Per-message latency of the chatbot intent classifier, before and after the
+precompiled intent index.
+
+    python benchmarks/bench_chatbot.py [--rounds 2000]
+
+Run from the repository root so app.py and its data files are found.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+MESSAGES = [
+    "hi",
+    "thanks",
+    "thank you so much",
+    "see you later",
+    "bye",
+    "when is my class time tomorrow?",
+    "how do I upload my lecture pdf files",
+    "can you remind me about the homework task due on friday",
+    "what's on my timetable",
+    "I need to set a reminder for the exam",
+    "tell me a joke",
+    "where can I find the documents I uploaded last week for physics",
+]
+
+def legacy_classify(message: str) -> str:
+    """The classifier as it was before the intent index (rebuilt per message).
+
+    Parses every message with spaCy, as the original preprocess() did; today's
+    preprocess() is memoized and batched and would hide that cost.
+    """
+    doc = app.get_nlp()(message.lower())
+    tokens = [token.lemma_ for token in doc if not token.is_stop and not token.is_punct]
+    intent_scores = {}
+    for intent, keywords in app.INTENTS.items():
+        intent_tokens = [kw.lower() for kw in keywords]
+        intent_scores[intent] = len(set(tokens) & set(intent_tokens))
+    best_intent = max(intent_scores, key=intent_scores.get)
+    return best_intent if intent_scores[best_intent] else "default"
+
+def measure(classify, rounds: int):
+    samples = []
+    for _ in range(rounds):
+        for message in MESSAGES:
+            start = time.perf_counter()
+            classify(message)
+            samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        'mean_us': statistics.fmean(samples) * 1e6,
+        'p50_us': samples[len(samples) // 2] * 1e6,
+        'p95_us': samples[int(len(samples) * 0.95)] * 1e6,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+
+    for message in MESSAGES:
+        print(f"{message!r:70} legacy={legacy_classify(message):10} indexed={app.classify_intent(message)}")
+    print()
+    for name, classify in (('legacy', legacy_classify), ('indexed', app.classify_intent)):
+        stats = measure(classify, args.rounds)
+        print(f"{name:8} mean {stats['mean_us']:8.1f} us   p50 {stats['p50_us']:8.1f} us   p95 {stats['p95_us']:8.1f} us")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""Logins per second through the password pool, per core and in total.
+
+    python benchmarks/bench_login.py [--users 50] [--seconds 5] [--clients 1 2 4 8]
+
+Runs against a throwaway SQLite database so real accounts are untouched.
+Each client thread posts to the login route through the Flask test client;
+half the users start with legacy plaintext records, which get upgraded on
+their first login, and the report shows how many records remain plaintext.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+os.chdir(ROOT)
+os.environ['STUDIST_DB'] = os.path.join(tempfile.mkdtemp(prefix='studist-bench-'), 'bench.db')
+
+import app  # noqa: E402
+
+def seed(users: int):
+    for i in range(users):
+        username = f"bench{i}"
+        if i % 2:
+            record = {'username': username, 'password_hash': app.generate_password_hash(
+                username, app.app.config['PASSWORD_HASH_METHOD'])}
+        else:
+            record = {'username': username, 'password': username}
+        app.STORE.put('users', username, record)
+
+def run(clients: int, users: int, seconds: float):
+    counts = {'ok': 0, 'busy': 0, 'failed': 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def worker(n):
+        client = app.app.test_client()
+        i = n
+        while time.perf_counter() < deadline:
+            username = f"bench{i % users}"
+            response = client.post('/', data={'username': username, 'password': username})
+            outcome = 'ok' if response.status_code == 302 else 'busy' if response.status_code == 503 else 'failed'
+            with lock:
+                counts[outcome] += 1
+            i += clients
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    counts['elapsed'] = time.perf_counter() - start
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--clients', type=int, nargs='+', default=[1, 2, 4, 8])
+    args = parser.parse_args()
+
+    seed(args.users)
+    cores = os.cpu_count() or 1
+    print(f"method {app.app.config['PASSWORD_HASH_METHOD']}, "
+          f"{app.PASSWORD_POOL.max_workers} pool workers, {cores} cores")
+    for clients in args.clients:
+        counts = run(clients, args.users, args.seconds)
+        rate = counts['ok'] / counts['elapsed']
+        print(f"{clients:3} clients  {rate:7.1f} logins/s  {rate / cores:7.1f} /s/core  "
+              f"busy {counts['busy']:4}  failed {counts['failed']:4}")
+    plaintext = sum(1 for _, user in app.STORE.items('users') if 'password' in user)
+    print(f"plaintext records left: {plaintext}/{args.users}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,388 @@
+"""Latency, throughput and memory of the main routes under synthetic load.
+
+    python benchmarks/loadtest.py [--scale 10|1000|100000] [--server flask|gunicorn]
+                                  [--requests 300] [--concurrency 4]
+                                  [--save NAME] [--compare NAME]
+
+Everything runs in a throwaway working directory with its own SQLite
+database, and STUDIST_LLM=stub replaces OpenAI, so no real data or network
+is touched. ``--scale`` is the number of synthetic users; each one gets
+``--items`` reminders, assignments and notes plus a timetable.
+
+Each route is first driven on its own, which gives per-route throughput and
+the RSS of the server afterwards, and then all routes together in a weighted
+mix. ``--server flask`` calls the app in process through the Flask test
+client; ``--server gunicorn`` starts a real gunicorn and talks HTTP to it.
+
+``--save NAME`` writes the results to benchmarks/baselines/NAME.json and
+``--compare NAME`` prints the change against such a file, so runs can be
+compared across commits on the same machine.
+"""
+import argparse
+import http.cookiejar
+import io
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE_DIR = os.path.join(ROOT, 'benchmarks', 'baselines')
+PASSWORD = 'loadtest'
+
+SUBJECTS = ['Maths', 'Physics', 'Chemistry', 'Biology', 'History', 'English', 'Economics', 'Art']
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+CHAT_MESSAGES = [
+    "hi",
+    "when is my class time tomorrow?",
+    "how do I upload my lecture pdf files",
+    "can you remind me about the homework task due on friday",
+    "what's on my timetable",
+    "thanks, bye",
+]
+# Not a valid PDF; /upload-handwriting only checks the extension.
+HANDWRITING_FILE = b"%PDF-1.4\n% loadtest page\n" + b"0" * 4096
+
+# ---------- Synthetic data ----------
+def synthetic_timetable(rng: random.Random) -> dict:
+    # The grid the timetable page posts: 12 hourly slots per day.
+    return {day: [{'value': rng.choice(SUBJECTS + [''] * 4), 'note': ''} for _ in range(12)] for day in DAYS}
+
+def seed(app_module, users: int, items: int, rng: random.Random) -> list:
+    """Bulk-load ``users`` accounts with ``items`` records of each kind."""
+    method = app_module.app.config['PASSWORD_HASH_METHOD']
+    # One hash shared by every account; hashing 100k passwords would dominate setup.
+    password_hash = app_module.generate_password_hash(PASSWORD, method)
+    today = datetime.today()
+    usernames = [f"user{i:06d}" for i in range(users)]
+    data = {name: {} for name in ('users', 'reminders', 'assignments', 'timetable', 'note_items')}
+    for username in usernames:
+        data['users'][username] = {'username': username, 'password_hash': password_hash}
+        data['reminders'][username] = [
+            {'title': f"Reminder {j}",
+             'date': (today + timedelta(days=rng.randint(-3, 10))).strftime('%Y-%m-%d'),
+             'time': f"{rng.randint(8, 20):02d}:00"}
+            for j in range(items)
+        ]
+        data['assignments'][username] = [
+            {'subject': f"{rng.choice(SUBJECTS)} {j}",
+             'due_date': (today + timedelta(days=rng.randint(-3, 10))).strftime('%Y-%m-%d'),
+             'description': 'Synthetic assignment', 'completed': rng.random() < 0.3}
+            for j in range(items)
+        ]
+        data['timetable'][username] = synthetic_timetable(rng)
+        for j in range(items):
+            note_id = uuid.UUID(int=rng.getrandbits(128)).hex[:12]
+            data['note_items'][app_module.note_key(username, note_id)] = {
+                'id': note_id, 'title': f"Note {j}", 'content': 'Lorem ipsum dolor sit amet. ' * 20,
+                'date': today.strftime('%Y-%m-%d'), 'created': j, 'version': 1,
+            }
+    for collection, mapping in data.items():
+        app_module.STORE.save_collection(collection, mapping)
+    return usernames
+
+# ---------- Clients ----------
+class FlaskClient:
+    """In-process requests through the Flask test client."""
+
+    def __init__(self, flask_app):
+        self.client = flask_app.test_client()
+
+    def request(self, method, path, data=None, json_body=None, files=None):
+        if files:
+            data = dict(data or {})
+            for field, (filename, content) in files.items():
+                data[field] = (io.BytesIO(content), filename)
+        response = self.client.open(path, method=method, data=data, json=json_body)
+        response.get_data()
+        return response.status_code
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+class HttpClient:
+    """Real HTTP with a cookie jar, for the gunicorn server."""
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), _NoRedirect())
+
+    def request(self, method, path, data=None, json_body=None, files=None):
+        headers = {}
+        body = None
+        if files:
+            boundary = uuid.uuid4().hex
+            parts = []
+            for field, value in (data or {}).items():
+                parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"\r\n\r\n'
+                             f'{value}\r\n'.encode('utf-8'))
+            for field, (filename, content) in files.items():
+                parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; '
+                             f'filename="{filename}"\r\nContent-Type: application/octet-stream\r\n\r\n'
+                             .encode('utf-8') + content + b'\r\n')
+            body = b''.join(parts) + f'--{boundary}--\r\n'.encode('utf-8')
+            headers['Content-Type'] = f'multipart/form-data; boundary={boundary}'
+        elif json_body is not None:
+            body = json.dumps(json_body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        elif data is not None:
+            body = urllib.parse.urlencode(data).encode('utf-8')
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        try:
+            with self.opener.open(req, timeout=120) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            return e.code
+
+# ---------- Routes ----------
+def route_dashboard(client, username, rng):
+    return client.request('GET', f"/dashboard?user={username}")
+
+def route_notifications(client, username, rng):
+    return client.request('GET', f"/notifications_data?user={username}")
+
+def route_chatbot(client, username, rng):
+    return client.request('POST', '/chatbot', json_body={'message': rng.choice(CHAT_MESSAGES)})
+
+def route_notes(client, username, rng):
+    if rng.random() < 0.8:
+        return client.request('GET', f"/notes?user={username}")
+    return client.request('POST', f"/notes?user={username}", data={
+        'action': 'save', 'title': 'Load test note', 'content': 'Lorem ipsum dolor sit amet. ' * 20, 'date': ''})
+
+def route_save_timetable(client, username, rng):
+    return client.request('POST', '/save-timetable', json_body={'timetable': synthetic_timetable(rng)})
+
+def route_patch_timetable(client, username, rng):
+    changes = [{'day': rng.choice(DAYS), 'slot': rng.randrange(12), 'value': rng.choice(SUBJECTS), 'note': ''}
+               for _ in range(rng.randint(1, 3))]
+    return client.request('PATCH', '/timetable', json_body={'changes': changes})
+
+def route_load_timetable(client, username, rng):
+    return client.request('GET', '/load-timetable')
+
+def route_upload_handwriting(client, username, rng):
+    # A small topic pool, so the mix sees both generation and assignment-cache hits.
+    return client.request('POST', '/upload-handwriting',
+                          data={'topic': f"{rng.choice(SUBJECTS)} revision {rng.randint(1, 20)}"},
+                          files={'file': ('page.pdf', HANDWRITING_FILE)})
+
+# name -> (driver, weight in the mixed run)
+ROUTES = {
+    '/dashboard': (route_dashboard, 25),
+    '/notifications_data': (route_notifications, 30),
+    '/chatbot': (route_chatbot, 20),
+    '/notes': (route_notes, 15),
+    '/save-timetable': (route_save_timetable, 2),
+    'PATCH /timetable': (route_patch_timetable, 6),
+    '/load-timetable': (route_load_timetable, 6),
+    '/upload-handwriting': (route_upload_handwriting, 2),
+}
+
+# ---------- Measurement ----------
+def rss_mb(pids) -> float:
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith('VmRSS:'):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total / 1024
+
+def child_pids(pid: int) -> list:
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            return [int(p) for p in f.read().split()]
+    except OSError:
+        return []
+
+def percentile(sorted_samples, q: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    return sorted_samples[min(len(sorted_samples) - 1, int(len(sorted_samples) * q))]
+
+def drive(make_client, usernames, routes, total: int, concurrency: int, seed_value: int):
+    """Send ``total`` requests over ``concurrency`` logged-in clients; latencies per route."""
+    weights = [ROUTES[name][1] for name in routes]
+    samples = {name: [] for name in routes}
+    errors = {name: 0 for name in routes}
+    lock = threading.Lock()
+    remaining = [total]
+
+    def worker(n):
+        rng = random.Random(seed_value * 1000 + n)
+        username = rng.choice(usernames)
+        client = make_client()
+        client.request('POST', '/', data={'username': username, 'password': PASSWORD})
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            name = rng.choices(routes, weights)[0]
+            start = time.perf_counter()
+            status = ROUTES[name][0](client, username, rng)
+            elapsed = time.perf_counter() - start
+            with lock:
+                samples[name].append(elapsed)
+                if status >= 400:
+                    errors[name] += 1
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(concurrency)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+    results = {}
+    for name in routes:
+        s = sorted(samples[name])
+        results[name] = {
+            'requests': len(s),
+            'errors': errors[name],
+            'rps': len(s) / wall if wall else 0.0,
+            'p50_ms': percentile(s, 0.50) * 1000,
+            'p95_ms': percentile(s, 0.95) * 1000,
+            'p99_ms': percentile(s, 0.99) * 1000,
+        }
+    return results
+
+# ---------- Servers ----------
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def start_gunicorn(workdir: str, workers: int, threads: int):
+    port = free_port()
+    proc = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--pythonpath', ROOT, '--workers', str(workers),
+         '--threads', str(threads), '--bind', f"127.0.0.1:{port}", '--log-level', 'warning', 'app:app'],
+        cwd=workdir, env=os.environ.copy(),
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        try:
+            urllib.request.urlopen(base_url + '/favicon.ico', timeout=1).read()
+            return proc, base_url
+        except OSError:
+            if proc.poll() is not None:
+                raise SystemExit('gunicorn exited during startup')
+            time.sleep(0.2)
+    proc.terminate()
+    raise SystemExit('gunicorn did not start within 60s')
+
+# ---------- Reporting ----------
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ''
+
+def print_table(title: str, results: dict, baseline=None):
+    print(f"\n{title}")
+    print(f"{'route':22} {'reqs':>6} {'err':>4} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'rss MB':>8}")
+    for name, r in results.items():
+        line = (f"{name:22} {r['requests']:6} {r['errors']:4} {r['rps']:8.1f} {r['p50_ms']:8.1f} "
+                f"{r['p95_ms']:8.1f} {r['p99_ms']:8.1f} {r.get('rss_mb', 0):8.1f}")
+        before = (baseline or {}).get(name)
+        if before:
+            deltas = []
+            for key in ('rps', 'p50_ms', 'p95_ms', 'p99_ms'):
+                if before.get(key):
+                    deltas.append(f"{key} {100 * (r[key] - before[key]) / before[key]:+.0f}%")
+            line += '   vs baseline: ' + ', '.join(deltas)
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', type=int, default=10, help='number of synthetic users')
+    parser.add_argument('--items', type=int, default=5, help='reminders/assignments/notes per user')
+    parser.add_argument('--server', choices=('flask', 'gunicorn'), default='flask')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+    parser.add_argument('--requests', type=int, default=300, help='requests per phase')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', metavar='NAME')
+    parser.add_argument('--compare', metavar='NAME')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='studist-loadtest-')
+    os.environ['STUDIST_DB'] = os.path.join(workdir, 'studist.db')
+    os.environ.setdefault('STUDIST_LLM', 'stub')
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    import app as app_module
+
+    start = time.perf_counter()
+    usernames = seed(app_module, args.scale, args.items, random.Random(args.seed))
+    print(f"seeded {len(usernames)} users x {args.items} items in {time.perf_counter() - start:.1f}s ({workdir})")
+
+    server = None
+    if args.server == 'gunicorn':
+        server, base_url = start_gunicorn(workdir, args.workers, args.threads)
+        make_client = lambda: HttpClient(base_url)  # noqa: E731
+        server_pids = lambda: [server.pid] + child_pids(server.pid)  # noqa: E731
+    else:
+        make_client = lambda: FlaskClient(app_module.app)  # noqa: E731
+        server_pids = lambda: [os.getpid()]  # noqa: E731
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json")) as f:
+            baseline = json.load(f)['results']
+
+    try:
+        isolated = {}
+        for i, name in enumerate(ROUTES):
+            result = drive(make_client, usernames, [name], args.requests, args.concurrency, args.seed + i)[name]
+            result['rss_mb'] = rss_mb(server_pids())
+            isolated[name] = result
+        mixed = drive(make_client, usernames, list(ROUTES), args.requests, args.concurrency, args.seed)
+        for result in mixed.values():
+            result['rss_mb'] = rss_mb(server_pids())
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    label = f"{args.server}, {args.scale} users, concurrency {args.concurrency}"
+    print_table(f"Isolated ({label})", isolated, baseline and baseline.get('isolated'))
+    print_table(f"Mixed ({label})", mixed, baseline and baseline.get('mixed'))
+
+    if args.save:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        path = os.path.join(BASELINE_DIR, f"{args.save}.json")
+        with open(path, 'w') as f:
+            json.dump({
+                'commit': git_commit(),
+                'date': datetime.now().isoformat(timespec='seconds'),
+                'args': vars(args),
+                'results': {'isolated': isolated, 'mixed': mixed},
+            }, f, indent=2)
+        print(f"\nsaved {path}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""Startup time and memory of app.py with lazy vs preloaded models.
+
+    python benchmarks/startup_report.py
+
+Each scenario runs in a fresh interpreter from the repository root and
+reports the import time, the time of the first /chatbot request and peak RSS.
+"""
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+first_chat = None
+if sys.argv[1] == 'chat':
+    client = app.app.test_client()
+    t = time.perf_counter()
+    client.post('/chatbot', json={'message': 'how do I upload my lecture files?'})
+    first_chat = time.perf_counter() - t
+print(json.dumps({
+    'import_s': imported - start,
+    'first_chat_s': first_chat,
+    'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+}))
+'''
+
+SCENARIOS = [
+    ('lazy import', {}, 'import'),
+    ('lazy import + first chat', {}, 'chat'),
+    ('preloaded import', {'STUDIST_PRELOAD': '1'}, 'import'),
+    ('preloaded import + first chat', {'STUDIST_PRELOAD': '1'}, 'chat'),
+]
+
+def run(env_overrides, mode):
+    env = dict(os.environ, **env_overrides)
+    out = subprocess.run([sys.executable, '-c', CHILD, mode], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+def main():
+    print(f"{'scenario':32} {'import':>9} {'1st chat':>9} {'peak RSS':>10}")
+    for name, env, mode in SCENARIOS:
+        r = run(env, mode)
+        chat = f"{r['first_chat_s']:8.3f}s" if r['first_chat_s'] is not None else '        -'
+        print(f"{name:32} {r['import_s']:8.3f}s {chat} {r['peak_rss_mb']:8.1f}MB")
+
+if __name__ == '__main__':
+    main()
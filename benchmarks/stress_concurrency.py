@@ -0,0 +1,216 @@
+"""Concurrency stress test: many processes writing the same users' data at once.
+
+    python benchmarks/stress_concurrency.py [--processes 4] [--threads 4] [--ops 50]
+                                            [--workers 4] [--backend sqlite|json]
+
+Exits non-zero if any update was lost. Runs in a throwaway data directory.
+
+1. Store: ``--processes`` x ``--threads`` writers run read-modify-write
+   updates against one shared document (a counter plus an append-only list)
+   and against per-writer rows, through their own STORE instances. Then a
+   row is deleted and re-created through one STORE and must not be served
+   stale from a second STORE's cache.
+2. HTTP: a gunicorn with ``--workers`` worker processes and server-side
+   sessions (STUDIST_SESSION_BACKEND=store). One shared login cookie is used by
+   every client thread, so requests for the same user and session land on
+   different workers. The clients add reminders in batches, create notes and
+   each keep overwriting their own timetable cell, then every write is checked
+   to be present and every cell to hold its client's last value.
+
+The SQLite backend is safe for any number of worker processes on one host.
+Its WAL mode needs shared memory, so hosts sharing one database file over a
+network filesystem are not supported; that needs a networked store behind the
+same STORE interface.
+"""
+import argparse
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+from loadtest import HttpClient, start_gunicorn  # noqa: E402
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+def import_app():
+    sys.path.insert(0, ROOT)
+    import app
+    return app
+
+# ---------- Store ----------
+def store_writer(process: int, threads: int, ops: int, ready, start) -> None:
+    app = import_app()
+    ready.wait()
+
+    def run(thread: int):
+        start.wait()
+        writer = f"p{process}t{thread}"
+        for i in range(ops):
+            app.STORE.update('stress', 'shared', lambda doc: {
+                'count': doc['count'] + 1,
+                'entries': doc['entries'] + [f"{writer}-{i}"],
+            }, {'count': 0, 'entries': []})
+            app.STORE.update('stress', writer, lambda n: n + 1, 0)
+
+    workers = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join()
+
+def stress_store(args) -> list:
+    ctx = multiprocessing.get_context('spawn')
+    ready = ctx.Barrier(args.processes + 1)
+    start = ctx.Event()
+
+    def arrive():
+        ready.wait()
+        start.set()
+
+    processes = [ctx.Process(target=store_writer, args=(p, args.threads, args.ops, ready, start))
+                 for p in range(args.processes)]
+    for p in processes:
+        p.start()
+    arrive()
+    began = time.perf_counter()
+    for p in processes:
+        p.join()
+    elapsed = time.perf_counter() - began
+
+    app = import_app()
+    app.STORE.invalidate('stress')
+    writers = args.processes * args.threads
+    expected = writers * args.ops
+    shared = app.STORE.get('stress', 'shared', {'count': 0, 'entries': []})
+    failures = []
+    if shared['count'] != expected:
+        failures.append(f"store: shared counter {shared['count']} != {expected}")
+    if len(set(shared['entries'])) != expected:
+        failures.append(f"store: shared list has {len(set(shared['entries']))} distinct entries, expected {expected}")
+    for p in range(args.processes):
+        for t in range(args.threads):
+            count = app.STORE.get('stress', f"p{p}t{t}", 0)
+            if count != args.ops:
+                failures.append(f"store: writer p{p}t{t} counted {count} != {args.ops}")
+    print(f"store: {writers} writers in {args.processes} processes, {expected * 2} updates "
+          f"in {elapsed:.1f}s ({expected * 2 / elapsed:.0f}/s)")
+    return failures
+
+def check_reinsert() -> list:
+    """Two STORE instances (as in two workers): a row deleted and re-created
+    through one must not be served stale from the other's cache."""
+    app = import_app()
+    other = app.CachedStore(app.create_store(app.app.config['STORAGE_BACKEND'], app.app.config['STORAGE_PATH']))
+    app.STORE.put('stress', 'reinsert', {'value': 'old'})
+    other.get('stress', 'reinsert')  # Cached at the first version.
+    app.STORE.delete('stress', 'reinsert')
+    app.STORE.put('stress', 'reinsert', {'value': 'new'})
+    seen = other.get('stress', 'reinsert')
+    app.STORE.save_collection('stress_rewrite', {'k': 1})
+    other.get('stress_rewrite', 'k')
+    app.STORE.save_collection('stress_rewrite', {'k': 2})
+    seen_rewrite = other.get('stress_rewrite', 'k')
+    failures = []
+    if seen != {'value': 'new'}:
+        failures.append(f"store: second instance served {seen} after delete + re-insert")
+    if seen_rewrite != 2:
+        failures.append(f"store: second instance served {seen_rewrite} after save_collection")
+    print("store: delete + re-insert seen by a second instance" if not failures else failures[0])
+    return failures
+
+# ---------- HTTP ----------
+def stress_http(args) -> list:
+    app = import_app()
+    username = 'stress'
+    app.STORE.put('users', username, {
+        'username': username,
+        'password_hash': app.generate_password_hash('stress', app.app.config['PASSWORD_HASH_METHOD']),
+    })
+    server, base_url = start_gunicorn(os.getcwd(), args.workers, 4)
+    failures = []
+    try:
+        login = HttpClient(base_url)
+        login.request('POST', '/', data={'username': username, 'password': 'stress'})
+        clients = args.processes * args.threads
+        slots = [(day, slot) for day in DAYS for slot in range(24)]
+        if clients > len(slots):
+            raise SystemExit(f"at most {len(slots)} HTTP clients (one timetable cell each)")
+        errors = []
+
+        def run(n: int):
+            client = HttpClient(base_url)
+            client.opener = login.opener  # Same session cookie on every worker.
+            for i in range(args.ops):
+                status = client.request('POST', '/api/reminders', json_body={'operations': [
+                    {'op': 'add', 'title': f"c{n}-{i}-a"}, {'op': 'add', 'title': f"c{n}-{i}-b"}]})
+                status2 = client.request('POST', '/api/notes', json_body={'title': f"c{n}-{i}", 'content': 'x'})
+                day, slot = slots[n]
+                status3 = client.request('PATCH', '/timetable', json_body={'changes': [
+                    {'day': day, 'slot': slot, 'value': f"c{n}-{i}"}]})
+                if status >= 400 or status2 >= 400 or status3 >= 400:
+                    errors.append((status, status2, status3))
+
+        began = time.perf_counter()
+        threads = [threading.Thread(target=run, args=(n,)) for n in range(clients)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - began
+
+        app.STORE.invalidate('reminders')
+        app.STORE.invalidate('timetable')
+        total = clients * args.ops
+        reminders = {r['title'] for r in app.STORE.get('reminders', username, [])}
+        notes = {n['title'] for n in app.load_notes(username)}
+        grid = app.decode_timetable(app.STORE.get('timetable', username, {}))
+        if errors:
+            failures.append(f"http: {len(errors)} requests failed, e.g. {errors[0]}")
+        if len(reminders) != total * 2:
+            failures.append(f"http: {len(reminders)} reminders stored, expected {total * 2}")
+        if len(notes) != total:
+            failures.append(f"http: {len(notes)} notes stored, expected {total}")
+        lost_cells = []
+        for n in range(clients):
+            day, slot = slots[n]
+            row = grid.get(day, [])
+            if len(row) <= slot or row[slot]['value'] != f"c{n}-{args.ops - 1}":
+                lost_cells.append((day, slot))
+        if lost_cells:
+            failures.append(f"http: {len(lost_cells)} timetable cells lost their last write, e.g. {lost_cells[0]}")
+        print(f"http: {clients} clients on {args.workers} gunicorn workers, {total * 3} requests "
+              f"in {elapsed:.1f}s ({total * 3 / elapsed:.0f}/s)")
+    finally:
+        server.terminate()
+        server.wait()
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=4)
+    parser.add_argument('--ops', type=int, default=50, help='operations per writer')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers for the HTTP run')
+    parser.add_argument('--backend', choices=('sqlite', 'json'), default='sqlite')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='studist-stress-')
+    os.environ['STUDIST_DATA_DIR'] = workdir
+    os.environ['STUDIST_STORAGE'] = args.backend
+    os.environ['STUDIST_SESSION_BACKEND'] = 'store'
+    os.environ.setdefault('STUDIST_LLM', 'stub')
+    os.chdir(workdir)
+
+    failures = stress_store(args) + check_reinsert() + stress_http(args)
+    for failure in failures:
+        print('LOST UPDATE:', failure)
+    print('OK: no lost updates' if not failures else f"FAILED: {len(failures)} problem(s)")
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+"""PDF page rendering for app.py's render process pool.
+
+Kept out of app.py so the pool's tasks pickle by reference to this module:
+spawned workers import only pdf2image, not the Flask app and its models.
+"""
+import os
+
+
+def render_pdf_page(pdf_path: str, page: int, dpi: int, out_path: str, thumbnail_width=None) -> None:
+    """Render one page of ``pdf_path`` to a PNG at ``out_path`` (written atomically)."""
+    from pdf2image import convert_from_path
+    images = convert_from_path(pdf_path, dpi=dpi, first_page=page, last_page=page)
+    if not images:
+        raise ValueError(f"Page {page} not found")
+    image = images[0]
+    if thumbnail_width:
+        image.thumbnail((thumbnail_width, thumbnail_width * 4))
+    tmp = f"{out_path}.{os.getpid()}.tmp"
+    image.save(tmp, 'PNG')
+    os.replace(tmp, out_path)
+
+
+def count_pdf_pages(pdf_path: str) -> int:
+    from pdf2image import pdfinfo_from_path
+    return int(pdfinfo_from_path(pdf_path)['Pages'])